@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+# generate a valid SIC/XE program of a given size for benchmarking, the program
+# is made of blocks of random instructions followed by their data
+
+import argparse
+import random
+
+# instruction kinds and their default weights in the mix
+DEFAULT_MIX = {"fmt1": 1, "fmt2": 3, "fmt3": 8, "fmt4": 1, "literal": 1}
+
+FMT1 = ["FIX", "FLOAT", "NORM"]
+FMT2_ONE = ["CLEAR", "TIXR"]
+FMT2_TWO = ["ADDR", "COMPR", "RMO", "SUBR"]
+FMT3 = ["LDA", "STA", "ADD", "SUB", "COMP", "LDX", "STX", "LDCH", "STCH"]
+JUMPS = ["J", "JEQ", "JGT", "JLT"]
+REGISTERS = ["A", "X", "S", "T"]
+
+# parse a mix like "fmt2=3,literal=0" over the default weights
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, text.split(',')):
+        kind, weight = item.split('=')
+        if kind not in mix:
+            raise ValueError("unknown instruction kind %s" % kind)
+        mix[kind] = int(weight)
+    return mix
+
+# one statement of the given kind inside block k, as (label, mnemonic, operand)
+def statement(rnd, kind, k):
+    if kind == "fmt1":
+        return ("", rnd.choice(FMT1), "")
+    elif kind == "fmt2":
+        if rnd.random() < 0.5:
+            return ("", rnd.choice(FMT2_ONE), rnd.choice(REGISTERS))
+        return ("", rnd.choice(FMT2_TWO), "%s,%s" % (rnd.choice(REGISTERS), rnd.choice(REGISTERS)))
+    elif kind == "fmt3":
+        r = rnd.random()
+        if r < 0.15:
+            return ("", rnd.choice(JUMPS), rnd.choice(["B%d" % k, "E%d" % k]))
+        elif r < 0.3:
+            return ("", rnd.choice(FMT3), "#%d" % rnd.randrange(4096))
+        elif r < 0.4:
+            return ("", rnd.choice(FMT3), "D%d,X" % k)
+        elif r < 0.5:
+            return ("", rnd.choice(FMT3), "@D%d" % k)
+        return ("", rnd.choice(FMT3), rnd.choice(["D%d" % k, "C%d" % k, "B%d" % k]))
+    elif kind == "fmt4":
+        r = rnd.random()
+        if r < 0.4:
+            return ("", "+JSUB", "E%d" % rnd.randrange(k + 1))
+        elif r < 0.7:
+            return ("", "+LDT", "#%d" % rnd.randrange(1 << 20))
+        return ("", "+" + rnd.choice(FMT3), "D%d" % k)
+    else:
+        if rnd.random() < 0.5:
+            return ("", rnd.choice(FMT3[:5]), "=C'%s'" % rnd.choice(["EOF", "OK", "ERR", "SIC", "XE"]))
+        return ("", "TD", "=X'%02X'" % rnd.randrange(8))
+
+# far data reached by base-relative addressing
+def far_block(k):
+    return [("", "+LDB", "#W%d" % k),
+            ("", "BASE", "W%d" % k),
+            ("", "LDA", "V%d" % k),
+            ("", "J", "N%d" % k),
+            ("R%d" % k, "RESB", "3000"),
+            ("W%d" % k, "RESW", "1"),
+            ("V%d" % k, "WORD", "5"),
+            ("N%d" % k, "CLEAR", "A"),
+            ("", "NOBASE", "")]
+
+# generate the statements of a program with about the given number of statements
+def generate(statements, mix=DEFAULT_MIX, block_size=12, ltorg_every=8, far_every=50, seed=0):
+    rnd = random.Random(seed)
+    kinds = [kind for kind in mix if mix[kind] > 0]
+    weights = [mix[kind] for kind in kinds]
+    yield ("PROG", "START", "0")
+    count = 1
+    k = 0
+    while count < statements:
+        body = [statement(rnd, kind, k) for kind in rnd.choices(kinds, weights, k=block_size)]
+        body[0] = ("B%d" % k,) + body[0][1:]
+        body.append(("E%d" % k, "RSUB", ""))
+        body.append(("D%d" % k, "WORD", "%X" % rnd.randrange(1 << 24)))
+        body.append(("C%d" % k, "BYTE", rnd.choice(["C'AB'", "X'1F'"])))
+        body.append(("Z%d" % k, "RESW", "%d" % rnd.randrange(1, 8)))
+        # place the pending literals before they are out of reach
+        if far_every and k % far_every == far_every - 1:
+            body.append(("", "LTORG", ""))
+            body.extend(far_block(k))
+        if ltorg_every and k % ltorg_every == ltorg_every - 1:
+            body.append(("", "LTORG", ""))
+        for stmt in body:
+            yield stmt
+        count += len(body)
+        k += 1
+    yield ("", "END", "B0")
+
+def write(f, stmts):
+    for label, mnemonic, operand in stmts:
+        f.write(("%-8s%-8s%s" % (label, mnemonic, operand)).rstrip() + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a SIC/XE program for benchmarking")
+    parser.add_argument('-n', '--statements', type=int, default=10000, help='approximate number of statements.')
+    parser.add_argument('-m', '--mix', default='', help='weights of instruction kinds, e.g. "fmt1=1,fmt2=3,fmt3=8,fmt4=1,literal=1".')
+    parser.add_argument('--ltorg-every', type=int, default=8, help='blocks between literal pools (0: only at END).')
+    parser.add_argument('--far-every', type=int, default=50, help='blocks between base-relative far data (0: never).')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the random generator.')
+    parser.add_argument('output', help='the generated source file.')
+    args = parser.parse_args()
+
+    with open(args.output, "w") as f:
+        write(f, generate(args.statements, parse_mix(args.mix), ltorg_every=args.ltorg_every, far_every=args.far_every, seed=args.seed))
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+# compare the memory used by the assembled lines against the former
+# dict based Line class, on a generated source of the given size
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import sicas
+
+# the Line class before __slots__, kept for comparison
+class DictLine:
+    def __init__(self, assembly, lineno):
+        self.src = assembly
+        self.assembly = assembly.split('.')[0]
+        self.code = ""
+        self.lineno = lineno
+        self.fmt = 0
+        self.loc = None
+        self.base = -1
+        self.litpool = []
+
+# a mix of comments, blank lines, instructions and data
+def source_lines(count):
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            yield ". comment %d" % i
+        elif kind == 1:
+            yield ""
+        elif kind == 2:
+            yield "L%-6d  LDA     #%d" % (i, i % 4096)
+        else:
+            yield "        STA     L%d" % (i - 1)
+
+# bytes allocated to hold count lines of cls, with code filled like assemble does
+def measure(cls, count):
+    tracemalloc.start()
+    lines = []
+    for lineno, src in enumerate(source_lines(count), 1):
+        line = cls(src, lineno)
+        if lineno % 4 > 1:
+            line.loc = lineno * 3
+            line.fmt = 3
+            line.code = 0x010000 | lineno
+        lines.append(line)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory benchmark of assembled lines")
+    parser.add_argument('-n', '--lines', type=int, default=100000, help='number of source lines.')
+    args = parser.parse_args()
+
+    before = measure(DictLine, args.lines)
+    after = measure(sicas.Line, args.lines)
+    print("%-10s%12s%12s" % ("", "bytes", "per line"))
+    print("%-10s%12d%12.1f" % ("dict", before, before / args.lines))
+    print("%-10s%12d%12.1f" % ("slots", after, after / args.lines))
+    print("saved %.1f%%" % (100 - after * 100 / before))
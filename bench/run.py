@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+# time each phase of the assembler on generated programs of several sizes,
+# save the results as JSON and compare them with a previous run
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import sicas
+import generate
+
+PHASES = ("init", "assemble", "listing", "output")
+# statements per second of lex alone and of Program.assemble
+RATES = ("lex", "assemble")
+
+# time the phases of one assemble of source, in seconds, return them with
+# the number of statements assembled
+def time_phases(source, tmpdir):
+    times = {}
+    t = time.perf_counter()
+    program = sicas.Program(source)
+    times["init"] = time.perf_counter() - t
+    t = time.perf_counter()
+    program.assemble()
+    times["assemble"] = time.perf_counter() - t
+    t = time.perf_counter()
+    program.listing(os.path.join(tmpdir, "bench.lst"))
+    times["listing"] = time.perf_counter() - t
+    t = time.perf_counter()
+    program.output(os.path.join(tmpdir, "bench.obj"))
+    times["output"] = time.perf_counter() - t
+    return times, program.stats.statements
+
+# statements classified per second by lex, the statements of source are read
+# first and only lex is timed
+def time_lex(source):
+    with open(source, "r") as f:
+        texts = [sicas.Line(text.rstrip('\n'), 0).assembly for text in f]
+    texts = [text for text in texts if text.strip()]
+    t = time.perf_counter()
+    for text in texts:
+        sicas.lex(text)
+    return len(texts) / (time.perf_counter() - t)
+
+# best time of each phase over repeat runs for each size
+def run(sizes, repeat, seed):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            source = os.path.join(tmpdir, "bench%d.asm" % size)
+            with open(source, "w") as f:
+                generate.write(f, generate.generate(size, seed=seed))
+            best = {}
+            rates = {}
+            for _ in range(repeat):
+                times, statements = time_phases(source, tmpdir)
+                for phase, seconds in times.items():
+                    best[phase] = min(best.get(phase, seconds), seconds)
+                rates["assemble"] = max(rates.get("assemble", 0), statements / times["assemble"])
+                rates["lex"] = max(rates.get("lex", 0), time_lex(source))
+            results.append({"size": size, "times": best, "rates": rates})
+    return results
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def report(results, baseline=None):
+    base = {}
+    base_rates = {}
+    if baseline:
+        base = {entry["size"]: entry["times"] for entry in baseline["results"]}
+        base_rates = {entry["size"]: entry.get("rates", {}) for entry in baseline["results"]}
+    print("%-10s" % "size" + "".join("%14s" % phase for phase in PHASES) + "%14s" % "total" + "".join("%16s" % (rate + " stmt/s") for rate in RATES))
+    for entry in results:
+        times = entry["times"]
+        times = dict(times, total=sum(times.values()))
+        row = "%-10d" % entry["size"]
+        for phase in PHASES + ("total",):
+            cell = "%.4f" % times[phase]
+            old = base.get(entry["size"])
+            if old:
+                old = dict(old, total=sum(old.values()))
+                cell += " %+4.0f%%" % ((times[phase] / old[phase] - 1) * 100)
+            row += "%14s" % cell
+        for rate in RATES:
+            cell = "%.0fk" % (entry["rates"][rate] / 1000)
+            old = base_rates.get(entry["size"], {}).get(rate)
+            if old:
+                cell += " %+4.0f%%" % ((entry["rates"][rate] / old - 1) * 100)
+            row += "%16s" % cell
+        print(row)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SIC/XE assembler")
+    parser.add_argument('-n', '--sizes', default='1000,10000,100000', help='comma separated numbers of statements.')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per size, the best time is kept.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the program generator.')
+    parser.add_argument('--save', help='save the results to this file (default: bench/results/<revision>.json).')
+    parser.add_argument('--compare', help='compare with the results saved in this file.')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    data = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "results": run(sizes, args.repeat, args.seed),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("compared with %s" % baseline["revision"])
+    report(data["results"], baseline)
+
+    save = args.save or os.path.join(BENCH_DIR, "results", data["revision"] + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(save)), exist_ok=True)
+    with open(save, "w") as f:
+        json.dump(data, f, indent=2)
+    print("results saved to %s" % save)
@@ -0,0 +1,274 @@
+#!/usr/bin/python
+
+# binary object files, an alternative to the H/T/M/E text records which is
+# read through mmap without parsing the records
+#
+#   header         magic, version and number of control sections
+#   section table  one entry per control section
+#   per section    the code of its text records packed one after another,
+#                  then the tables of its text blocks, D, R and M records
+#
+# the reserved space takes no room in the file, a section is loaded by copying
+# each text block at its address; the text blocks keep the extent of each T
+# record so the text object file is converted back unchanged
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"SICXEOBJ"
+VERSION = 2
+
+HEADER = struct.Struct(">8sHH4x")
+# name, start, length, entry and the (offset, size) of the code and the
+# (offset, count) of the tables
+SECTION = struct.Struct(">6s2x13I")
+# address, file offset and size of a text record
+BLOCK = struct.Struct(">III4x")
+DEFINITION = struct.Struct(">6s2xI")
+REFERENCE = struct.Struct(">6s2x")
+# address, half-bytes, sign and symbol, the sign is 0 if relocated by the section
+MODIFICATION = struct.Struct(">IBc6s")
+
+NO_ENTRY = 0xFFFFFFFF
+ALIGNMENT = 8
+
+# A class to indicate an invalid object file
+class ObjectFormatError(Exception):
+    pass
+
+# class of a control section of a binary object file, the tables are unpacked
+# from the view of the file when they are iterated
+class Section:
+    __slots__ = ('name', 'start', 'length', 'entry', 'view', 'tables')
+
+    def __init__(self, view, name, start, length, entry, code, size, *tables):
+        self.name = name.rstrip(b"\0 ").decode()
+        self.start = start
+        self.length = length
+        self.entry = None if entry == NO_ENTRY else entry
+        if code + size > len(view):
+            raise ObjectFormatError("The code of section %s is truncated." % self.name)
+        self.view = view
+        self.tables = tables
+
+    def table(self, n, layout):
+        offset, count = self.tables[n * 2:n * 2 + 2]
+        if offset + count * layout.size > len(self.view):
+            raise ObjectFormatError("The tables of section %s are truncated." % self.name)
+        return layout.iter_unpack(self.view[offset:offset + count * layout.size])
+
+    # (address, file offset, size) of each text record
+    def blocks(self):
+        for addr, offset, size in self.table(0, BLOCK):
+            if offset + size > len(self.view) or addr < self.start or addr + size > self.start + self.length:
+                raise ObjectFormatError("Text block at %06X of section %s is invalid." % (addr, self.name))
+            yield (addr, offset, size)
+
+    # (name, address) of each D record entry
+    def definitions(self):
+        for name, addr in self.table(1, DEFINITION):
+            yield (decode_name(name), addr)
+
+    def references(self):
+        for name, in self.table(2, REFERENCE):
+            yield decode_name(name)
+
+    # (address, half-bytes, "+SYMBOL", "-SYMBOL" or "")
+    def modifications(self):
+        for addr, halfbytes, sign, name in self.table(3, MODIFICATION):
+            yield (addr, halfbytes, "" if sign == b"\0" else sign.decode() + decode_name(name))
+
+    # the code of a text block, copied so no view of the file outlives it
+    def code(self, offset, size):
+        return bytes(self.view[offset:offset + size])
+
+def decode_name(name):
+    return name.rstrip(b"\0 ").decode()
+
+# class of a binary object file held in a buffer, only the header and the
+# section table are read when it is opened
+class BinaryObject:
+    def __init__(self, data):
+        self.view = memoryview(data)
+        if len(self.view) < HEADER.size:
+            raise ObjectFormatError("Not a binary object file.")
+        magic, version, count = HEADER.unpack_from(self.view)
+        if magic != MAGIC:
+            raise ObjectFormatError("Not a binary object file.")
+        if version != VERSION:
+            raise ObjectFormatError("Unsupported binary object version %d." % version)
+        if HEADER.size + count * SECTION.size > len(self.view):
+            raise ObjectFormatError("The section table is truncated.")
+        self.sections = [Section(self.view, *SECTION.unpack_from(self.view, HEADER.size + i * SECTION.size)) for i in range(count)]
+
+    # the entry point of the object file, from its first control section
+    @property
+    def entry(self):
+        if self.sections:
+            return self.sections[0].entry
+        return None
+
+    def release(self):
+        self.sections = []
+        self.view.release()
+
+# class to map a binary object file, the pages of an image are only read when
+# they are accessed
+class MappedObject(BinaryObject):
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ObjectFormatError("Not a binary object file.")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            BinaryObject.__init__(self, self.map)
+        except ObjectFormatError:
+            self.map.close()
+            raise
+
+    # a view of the mapping still referenced, such as a table being iterated,
+    # keeps it open until the view is collected
+    def close(self):
+        try:
+            self.release()
+            self.map.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def is_binary(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+# class to collect the records of a control section in the text object format
+class TextSection:
+    def __init__(self, record):
+        self.name = record[1:7].rstrip()
+        self.start = int(record[7:13], 16)
+        self.length = int(record[13:19], 16)
+        self.entry = NO_ENTRY
+        self.code = bytearray()
+        self.blocks = []
+        self.definitions = []
+        self.references = []
+        self.modifications = []
+
+    def text(self, record):
+        addr = int(record[1:7], 16)
+        size = int(record[7:9], 16)
+        if addr < self.start or addr + size > self.start + self.length:
+            raise ObjectFormatError("Text record at %06X is outside section %s." % (addr, self.name))
+        code = bytes.fromhex(record[9:9 + size * 2])
+        if len(code) != size:
+            raise ObjectFormatError("Text record at %06X is truncated." % addr)
+        self.blocks.append((addr, len(self.code), size))
+        self.code += code
+
+# convert the records of a text object file to a binary object file
+def text_to_binary(records):
+    sections = []
+    for record in records:
+        record = record.rstrip('\r\n')
+        kind = record[:1]
+        if not record:
+            continue
+        if kind != 'H' and not sections:
+            raise ObjectFormatError("The object file does not begin with an H record.")
+        try:
+            if kind == 'H':
+                sections.append(TextSection(record))
+                continue
+            section = sections[-1]
+            if kind == 'T':
+                section.text(record)
+            elif kind == 'D':
+                for i in range(1, len(record), 12):
+                    section.definitions.append((record[i:i + 6].rstrip(), int(record[i + 6:i + 12], 16)))
+            elif kind == 'R':
+                section.references.extend(record[i:i + 6].rstrip() for i in range(1, len(record), 6))
+            elif kind == 'M':
+                section.modifications.append((int(record[1:7], 16), int(record[7:9], 16), record[9:10], record[10:].rstrip()))
+            elif kind == 'E':
+                if len(record) > 1:
+                    section.entry = int(record[1:7], 16)
+            else:
+                raise ObjectFormatError("Unknown record %s." % record)
+        except ValueError:
+            raise ObjectFormatError("Invalid record %s." % record)
+    return pack(sections)
+
+def pack(sections):
+    table = []
+    data = bytearray()
+    offset = HEADER.size + len(sections) * SECTION.size
+    for section in sections:
+        data += bytes(-(offset + len(data)) % ALIGNMENT)
+        code = offset + len(data)
+        data += section.code
+        tables = []
+        for rows, layout, row in ((section.blocks, BLOCK, lambda r: (r[0], code + r[1], r[2])),
+                                  (section.definitions, DEFINITION, lambda r: (r[0].encode(), r[1])),
+                                  (section.references, REFERENCE, lambda r: (r.encode(),)),
+                                  (section.modifications, MODIFICATION, lambda r: (r[0], r[1], r[2].encode() or b"\0", r[3].encode()))):
+            data += bytes(-(offset + len(data)) % ALIGNMENT)
+            tables += [offset + len(data), len(rows)]
+            for r in rows:
+                data += layout.pack(*row(r))
+        table.append(SECTION.pack(section.name.encode(), section.start, section.length, section.entry, code, len(section.code), *tables))
+    return HEADER.pack(MAGIC, VERSION, len(sections)) + b"".join(table) + data
+
+# convert a binary object file to the records of a text object file
+def binary_to_text(obj):
+    for section in obj.sections:
+        yield "H%-6s%06X%06X" % (section.name, section.start, section.length)
+        definitions = list(section.definitions())
+        for i in range(0, len(definitions), 5):
+            yield "D" + "".join(["%-6s%06X" % entry for entry in definitions[i:i + 5]])
+        references = list(section.references())
+        for i in range(0, len(references), 12):
+            yield "R" + "".join(["%-6s" % name for name in references[i:i + 12]])
+        for addr, offset, size in section.blocks():
+            yield "T%06X%02X%s" % (addr, size, section.code(offset, size).hex().upper())
+        for addr, halfbytes, symbol in section.modifications():
+            yield "M%06X%02X%s" % (addr, halfbytes, symbol)
+        if section.entry is None:
+            yield "E"
+        else:
+            yield "E%06X" % section.entry
+
+# convert an object file to the other format, return the format written
+def convert(source, output):
+    if is_binary(source):
+        with MappedObject(source) as obj:
+            text = "\n".join(binary_to_text(obj))
+        with open(output, "w") as f:
+            f.write(text)
+        return "text"
+    with open(source, "r") as f:
+        data = text_to_binary(f)
+    with open(output, "wb") as f:
+        f.write(data)
+    return "binary"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a SIC/XE object file between the text and binary formats")
+    parser.add_argument('-o', '--output', help='the output file (default: the input with .bin or .obj).')
+    parser.add_argument('input', help='the object file, text or binary.')
+    args = parser.parse_args()
+
+    output = args.output
+    try:
+        if output is None:
+            output = os.path.splitext(args.input)[0] + (".obj" if is_binary(args.input) else ".bin")
+        fmt = convert(args.input, output)
+    except (ObjectFormatError, OSError) as e:
+        print("Error : %s" % e)
+        sys.exit(1)
+    print("%s written in the %s format." % (output, fmt))
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+# default size limit of the cache, in bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# class of a content-addressed cache of object files and listings, entries are
+# keyed on the source, the assembler version and options, and evicted by LRU
+class Cache:
+    def __init__(self, directory, version, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.version = version
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    # compute the key of a source file assembled with the given options
+    def key(self, source, *options):
+        h = hashlib.sha256()
+        h.update(self.version.encode())
+        for option in options:
+            h.update(b'\0' + repr(option).encode())
+        h.update(b'\0')
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    # copy the cached object (and listing) to the given files, return False on miss
+    def restore(self, key, output, listing=None):
+        entries = [(self.path(key, ".obj"), output)]
+        if listing:
+            entries.append((self.path(key, ".lst"), listing))
+        try:
+            for cached, target in entries:
+                shutil.copyfile(cached, target)
+                # mark the entry as recently used
+                os.utime(cached)
+        except FileNotFoundError:
+            return False
+        return True
+
+    # add the assembled object (and listing) to the cache
+    def store(self, key, output, listing=None):
+        # the listing is stored first, an entry exists once its object does
+        entries = []
+        if listing:
+            entries.append((listing, self.path(key, ".lst")))
+        entries.append((output, self.path(key, ".obj")))
+        for target, cached in entries:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(target, tmp)
+            os.replace(tmp, cached)
+        self.evict()
+
+    # remove the least recently used entries until the cache fits in max_size
+    def evict(self):
+        files = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith((".obj", ".lst")):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        if total <= self.max_size:
+            return
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
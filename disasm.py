@@ -0,0 +1,337 @@
+#!/usr/bin/python
+
+import argparse
+import bisect
+import sys
+from sicxe import *
+from sicas import REGISTER_PAIR, SHIFTS
+
+# register names by number
+REGISTERS = {num: name for name, num in PRELOAD_SYMTAB.items()}
+
+# the addressing prefix of the ni bits, SIC instructions (ni = 0) are not
+# written by sicas.py
+PREFIXES = {1: "#", 2: "@", 3: ""}
+
+# the most bytes sicas.py writes in a text record
+MAX_TEXT = 30
+
+RSUB = OPTAB["RSUB"].opcode | DEFAULT_ADDR
+
+# the statements which need a label
+DATA = ("BYTE", "WORD", "RESB")
+
+# the instructions which load B, its register operand is the first or the second
+LOADS_B = {"CLEAR": 0, "SHIFTL": 0, "SHIFTR": 0, "ADDR": 1, "SUBR": 1, "MULR": 1, "DIVR": 1, "RMO": 1}
+
+# build the table decoding the first byte of an instruction, each entry is
+# (mnemonic, format) or None, format 3/4 opcodes take 4 entries for the ni bits
+def decode_table():
+    table = [None] * 256
+    for name, inst in OPTAB.items():
+        opcode = inst.opcode >> ((inst.fmt - 1) * BYTESIZE)
+        if inst.fmt == 3:
+            for ni in range(4):
+                table[opcode | ni] = (name, 3)
+        else:
+            table[opcode] = (name, inst.fmt)
+    return table
+
+DECODE = decode_table()
+
+def label(addr):
+    return "L%06X" % addr
+
+def register(num):
+    return REGISTERS.get(num, "%d" % num)
+
+# class of a control section of an object file, its records are kept until
+# the section is disassembled; sicas.py locates the statements from the start
+# address, and a control section from 0
+class Section:
+    def __init__(self, record, primary):
+        self.name = record[1:7].strip()
+        self.start = int(record[7:13], 16)
+        self.end = self.start + int(record[13:19], 16)
+        self.primary = primary
+        self.definitions = []
+        self.references = []
+        self.texts = []
+        self.modifications = {}
+        self.entry = None
+        self.labels = {self.start}
+
+    # the operand referring to addr, a label if it is in the section
+    def target(self, addr):
+        if self.start <= addr <= self.end:
+            self.labels.add(addr)
+            return label(addr)
+        return "%s%+d" % (label(self.start), addr - self.start)
+
+    # the operand of value relocated by the M records mods as sicas.py writes
+    # them, the section first and then the external symbols, None if it does
+    # not write them so
+    def relocated(self, value, mods, halfbytes):
+        symbols = [symbol for size, symbol in mods if symbol]
+        relative = len(mods) - len(symbols)
+        if any(size != halfbytes for size, symbol in mods) or relative > 1 or (relative and mods[0][1]):
+            return None
+        if relative:
+            operand = self.target(value)
+        elif value or symbols[0][0] == '-':
+            operand = "%d" % value
+        else:
+            operand = ""
+        return (operand + "".join(symbols)).lstrip('+')
+
+# decode the instruction at offset of code loaded at addr into a statement
+# which assembles back to the same bytes, return (size, mnemonic, operand) or
+# None if there is none; base is the address known to be in B, or None
+def decode(section, code, offset, addr, base):
+    entry = DECODE[code[offset]]
+    if entry is None:
+        return None
+    name, fmt = entry
+    remain = len(code) - offset
+    if fmt == 1:
+        return (1, name, "")
+    elif fmt == 2:
+        if remain < 2:
+            return None
+        r1 = code[offset + 1] >> 4
+        r2 = code[offset + 1] & 0xF
+        if name in SHIFTS:
+            return (2, name, "%s,%d" % (register(r1), r2 + 1))
+        if name in REGISTER_PAIR:
+            return (2, name, "%s,%s" % (register(r1), register(r2)))
+        if r2:
+            return None
+        if name == "SVC":
+            return (2, name, "%d" % r1)
+        return (2, name, register(r1))
+    if remain < 3:
+        return None
+    ni = code[offset] & 0x3
+    xbpe = code[offset + 1] >> 4
+    if ni == 0 or xbpe & 0x6 == 0x6:
+        return None
+    if name == "RSUB":
+        if int.from_bytes(code[offset:offset + 3], "big") != RSUB:
+            return None
+        return (3, name, "")
+    index = ",X" if xbpe & 0x8 else ""
+    if xbpe & 0x1:
+        if remain < 4 or xbpe & 0x6 or not OPTAB[name].inf & FORMAT4:
+            return None
+        target = ((code[offset + 1] & 0xF) << 16) | (code[offset + 2] << 8) | code[offset + 3]
+        mods = section.modifications.get(addr + 1)
+        # sicas.py relocates the address of every format 4 instruction which
+        # is not immediate, and an immediate one only for external symbols
+        if mods is None and ni == 1:
+            operand = section.target(target) if section.start <= target <= section.end else "%d" % target
+        elif mods is None or (ni == 1 and all(not symbol for size, symbol in mods)):
+            return None
+        else:
+            operand = section.relocated(target, mods, 5)
+            if operand is None:
+                return None
+        return (4, "+" + name, PREFIXES[ni] + operand + index)
+    if addr + 1 in section.modifications:
+        return None
+    disp = ((code[offset + 1] & 0xF) << 8) | code[offset + 2]
+    if xbpe & 0x2:
+        if disp & 0x800:
+            disp -= 0x1000
+        operand = section.target(addr + 3 + disp)
+    elif xbpe & 0x4:
+        # sicas.py only falls back to base-relative if PC-relative is out of reach
+        if base is None or -2048 <= base + disp - (addr + 3) < 2048:
+            return None
+        operand = section.target(base + disp)
+    else:
+        operand = "%d" % disp
+    return (3, name, PREFIXES[ni] + operand + index)
+
+# the address the statement loads into B, None if it is not known, or False
+# if B is left unchanged
+def base_loaded(mnemonic, operand):
+    if mnemonic.lstrip('+') == "LDB":
+        if operand[:2] == "#L" and "," not in operand and operand[2:].isalnum():
+            return int(operand[2:], 16)
+        return None
+    if mnemonic in LOADS_B and operand.split(',')[LOADS_B[mnemonic]] == "B":
+        return None
+    return False
+
+# decode the text records of a section into statements, each is
+# [addr, code, mnemonic, operand]; BASE and NOBASE follow the statements
+# loading B and take no code
+def statements(section):
+    words = {addr for addr, mods in section.modifications.items() if mods[0][0] == 6}
+    fields = {addr - 1 for addr, mods in section.modifications.items() if mods[0][0] == 5}
+    anchors = words | fields
+    # no instruction may come before the entry point, sicas.py takes the first one
+    entry = section.entry if section.primary and section.entry is not None else -1
+    result = []
+    base = None
+    for addr, code in section.texts:
+        offset = 0
+        while offset < len(code):
+            at = addr + offset
+            decoded = None
+            if at in words and offset + 3 <= len(code):
+                operand = section.relocated(int.from_bytes(code[offset:offset + 3], "big"), section.modifications[at], 6)
+                if operand is not None:
+                    decoded = (3, "WORD", operand)
+            elif at >= entry:
+                decoded = decode(section, code, offset, at, base)
+                # a statement must not cover a word or field relocated on its own
+                if decoded is not None and any(inside in anchors for inside in range(at + 1, at + decoded[0])):
+                    decoded = None
+            if decoded is None:
+                decoded = (1, None, None)
+            size, mnemonic, operand = decoded
+            result.append([at, code[offset:offset + size], mnemonic, operand])
+            offset += size
+            if mnemonic is not None and mnemonic != "WORD":
+                loaded = base_loaded(mnemonic, operand)
+                if loaded is not False and (loaded is not None or base is not None):
+                    base = loaded
+                    result.append([at + size, b"", "NOBASE" if loaded is None else "BASE", "" if loaded is None else label(loaded)])
+    return result
+
+# the bytes which are not statements are joined into BYTE constants; sicas.py
+# begins a new text record at a gap or when the next statement does not fit,
+# so the first statements of a record which follows the previous one are
+# joined until they no longer fit in it, and so is a record longer than that
+def join_bytes(section, decoded):
+    records = {addr: len(code) for addr, code in section.texts}
+    result = []
+    last = None
+    end = None
+    size = 0
+    for addr, code, mnemonic, operand in decoded:
+        if not code:
+            result.append([addr, code, mnemonic, operand])
+            continue
+        if addr in records:
+            start = addr
+            room = MAX_TEXT - size if addr == end else 0
+            size = records[addr]
+            end = addr + size
+            if size > MAX_TEXT:
+                room = size - 1
+        relocated = addr in section.modifications or addr + 1 in section.modifications
+        joined = last is not None and addr != start and result[last][2] is None and not relocated
+        if joined and (addr - start <= room or mnemonic is None and addr not in section.labels):
+            result[last][1] += code
+            continue
+        if addr == start and len(code) <= room and not relocated:
+            mnemonic = None
+        last = len(result)
+        result.append([addr, code, mnemonic, operand])
+    return result
+
+# the statements of a section with the reserved space between its text
+# records, each is (addr, size, label, mnemonic, operand, code)
+def place(section, joined):
+    placed = []
+    loc = section.start
+    for addr, code, mnemonic, operand in joined:
+        if code and addr > loc:
+            placed.append((loc, addr - loc, "RESB", "%d" % (addr - loc), b""))
+        elif code and addr < loc:
+            placed.append((addr, 0, "ORG", "%d" % addr, b""))
+        if mnemonic is None:
+            mnemonic, operand = "BYTE", "X'%s'" % code.hex().upper()
+        placed.append((addr, len(code), mnemonic, operand, code))
+        if code:
+            loc = addr + len(code)
+    if loc < section.end:
+        placed.append((loc, section.end - loc, "RESB", "%d" % (section.end - loc), b""))
+        loc = section.end
+    return placed, loc
+
+# disassemble a control section into statements which sicas.py assembles to
+# the same records; the addresses referred to are labeled, those inside a
+# statement by an EQU after it
+def disassemble_section(section):
+    definitions = [(name, section.target(addr)) for name, addr in section.definitions]
+    if section.primary and section.entry is not None:
+        section.target(section.entry)
+    placed, end = place(section, join_bytes(section, statements(section)))
+    starts = [stmt[0] for stmt in placed if stmt[1]]
+    begins = set(starts)
+    inner = {}
+    labels = set(section.labels)
+    for addr in sorted(section.labels):
+        i = bisect.bisect_right(starts, addr) - 1
+        if addr in begins or addr == end or i < 0:
+            continue
+        inner.setdefault(starts[i], []).append(addr)
+        labels.add(starts[i])
+
+    if section.primary:
+        yield "%-8s%-8s%X" % (section.name, "START", section.start)
+    else:
+        yield "%-8s%s" % (section.name, "CSECT")
+    if section.definitions:
+        yield "%-8s%-8s%s" % ("", "EXTDEF", ",".join([name for name, addr in section.definitions]))
+    if section.references:
+        yield "%-8s%-8s%s" % ("", "EXTREF", ",".join(section.references))
+    for addr, size, mnemonic, operand, code in placed:
+        name = label(addr) if size and (addr in labels or mnemonic in DATA) else ""
+        if code:
+            yield "%-8s%-8s%-24s. %04X %s" % (name, mnemonic, operand, addr, code.hex().upper())
+        else:
+            yield ("%-8s%-8s%s" % (name, mnemonic, operand)).rstrip()
+        for target in inner.get(addr, []) if size else []:
+            yield "%-8s%-8s%s+%d" % (label(target), "EQU", label(addr), target - addr)
+    if end in section.labels and end not in begins:
+        yield "%-8s%-8s*" % (label(end), "EQU")
+    for name, operand in definitions:
+        yield "%-8s%-8s%s" % (name, "EQU", operand)
+
+# disassemble an object file into a source, the control sections after the
+# first begin with CSECT
+def disassemble(f):
+    section = None
+    entry = None
+    for record in f:
+        record = record.rstrip('\r\n')
+        if not record:
+            continue
+        kind = record[0]
+        if kind == 'H':
+            section = Section(record, section is None)
+        elif section is None:
+            raise ValueError("The object file does not begin with an H record.")
+        elif kind == 'D':
+            for i in range(1, len(record), 12):
+                section.definitions.append((record[i:i + 6].strip(), int(record[i + 6:i + 12], 16)))
+        elif kind == 'R':
+            section.references.extend(record[i:i + 6].strip() for i in range(1, len(record), 6))
+        elif kind == 'T':
+            section.texts.append((int(record[1:7], 16), bytes.fromhex(record[9:9 + int(record[7:9], 16) * 2])))
+        elif kind == 'M':
+            section.modifications.setdefault(int(record[1:7], 16), []).append((int(record[7:9], 16), record[9:].strip()))
+        elif kind == 'E':
+            if len(record) > 1:
+                section.entry = int(record[1:7], 16)
+                if section.primary:
+                    entry = section.entry
+            yield from disassemble_section(section)
+    yield ("%-8s%-8s%s" % ("", "END", "" if entry is None else label(entry))).rstrip()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A SIC/XE object file disassembler")
+    parser.add_argument('-o', '--output', help='the output file (default: stdout).')
+    parser.add_argument('input', help='the object file.')
+    args = parser.parse_args()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    with open(args.input, "r") as f:
+        for line in disassemble(f):
+            out.write(line + "\n")
+    if args.output:
+        out.close()
@@ -0,0 +1,146 @@
+# operand expressions: the terms are symbols, decimal numbers and * (the
+# location counter) combined by + - * / and parentheses
+#
+# a parsed expression is a tree of tuples
+#   (NUM, value, relative, externals)   a term whose value is known
+#   (SYM, name)              a symbol not yet defined
+#   (LOC,)                   the location counter of the statement
+#   (NEG, tree)
+#   (op, left, right)        op is one of + - * /
+# relative counts the relative terms, +1 for an address and -1 for a
+# subtracted address, so END-START is absolute and LABEL+3 is relative;
+# externals lists the external symbols added or subtracted as "+NAME" or
+# "-NAME", which count as 0 in value
+import re
+
+NUM = 'n'
+SYM = 's'
+LOC = 'l'
+NEG = '~'
+
+TOKEN = re.compile(r"\s*(?:(\d+)|([A-Za-z_$][A-Za-z0-9_$]*)|(.))")
+
+# A class to indicate an invalid expression
+class ExpressionError(Exception):
+    pass
+
+def tokenize(text):
+    tokens = []
+    for number, symbol, char in TOKEN.findall(text):
+        if number:
+            tokens.append((NUM, int(number), 0, ()))
+        elif symbol:
+            tokens.append((SYM, symbol))
+        elif char.strip():
+            tokens.append(char)
+    return tokens
+
+# parse the text into a tree, the sub-expressions of numbers are folded
+def parse(text):
+    tokens = tokenize(text)
+    tree, pos = parse_sum(tokens, 0, text)
+    if pos != len(tokens):
+        raise ExpressionError("Unexpected \"%s\" in expression %s." % (token_text(tokens[pos]), text))
+    return tree
+
+def token_text(token):
+    if type(token) is tuple:
+        return str(token[1])
+    return token
+
+def parse_sum(tokens, pos, text):
+    tree, pos = parse_product(tokens, pos, text)
+    while pos < len(tokens) and tokens[pos] in ('+', '-'):
+        right, next_pos = parse_product(tokens, pos + 1, text)
+        tree = combine(tokens[pos], tree, right)
+        pos = next_pos
+    return (tree, pos)
+
+def parse_product(tokens, pos, text):
+    tree, pos = parse_term(tokens, pos, text)
+    while pos < len(tokens) and tokens[pos] in ('*', '/'):
+        right, next_pos = parse_term(tokens, pos + 1, text)
+        tree = combine(tokens[pos], tree, right)
+        pos = next_pos
+    return (tree, pos)
+
+# a * where a term is expected is the location counter
+def parse_term(tokens, pos, text):
+    if pos == len(tokens):
+        raise ExpressionError("Incomplete expression %s." % text)
+    token = tokens[pos]
+    if type(token) is tuple:
+        return (token, pos + 1)
+    if token == '*':
+        return ((LOC,), pos + 1)
+    if token == '-':
+        tree, pos = parse_term(tokens, pos + 1, text)
+        return (negate(tree), pos)
+    if token == '+':
+        return parse_term(tokens, pos + 1, text)
+    if token == '(':
+        tree, pos = parse_sum(tokens, pos + 1, text)
+        if pos == len(tokens) or tokens[pos] != ')':
+            raise ExpressionError("Unmatched parenthesis in expression %s." % text)
+        return (tree, pos + 1)
+    raise ExpressionError("Unexpected \"%s\" in expression %s." % (token, text))
+
+def negate(tree):
+    if tree[0] == NUM:
+        return (NUM, -tree[1], -tree[2], negate_externals(tree[3]))
+    return (NEG, tree)
+
+def negate_externals(externals):
+    return tuple(('-' if ref[0] == '+' else '+') + ref[1:] for ref in externals)
+
+# build the node of op, folding it if both operands are known
+def combine(op, left, right):
+    if left[0] == NUM and right[0] == NUM:
+        return apply(op, left, right)
+    return (op, left, right)
+
+def apply(op, left, right):
+    if op == '+':
+        return (NUM, left[1] + right[1], left[2] + right[2], left[3] + right[3])
+    if op == '-':
+        return (NUM, left[1] - right[1], left[2] - right[2], left[3] + negate_externals(right[3]))
+    if left[2] or right[2] or left[3] or right[3]:
+        raise ExpressionError("Relative terms are not allowed in \"%s\"." % op)
+    if op == '*':
+        return (NUM, left[1] * right[1], 0, ())
+    if right[1] == 0:
+        raise ExpressionError("Division by zero.")
+    return (NUM, int(left[1] / right[1]), 0, ())
+
+# replace the symbols defined in symtab or declared in externals and the
+# location counter (if loc is given) by their values and fold the nodes
+# which become known
+def fold(tree, symtab, absolute, loc=None, externals=()):
+    kind = tree[0]
+    if kind == NUM:
+        return tree
+    if kind == SYM:
+        value = symtab.get(tree[1])
+        if value is None:
+            if tree[1] in externals:
+                return (NUM, 0, 0, ('+' + tree[1],))
+            return tree
+        return (NUM, value, 0 if tree[1] in absolute else 1, ())
+    if kind == LOC:
+        if loc is None:
+            return tree
+        return (NUM, loc, 1, ())
+    if kind == NEG:
+        return negate(fold(tree[1], symtab, absolute, loc, externals))
+    return combine(kind, fold(tree[1], symtab, absolute, loc, externals), fold(tree[2], symtab, absolute, loc, externals))
+
+# the first symbol of the tree not yet defined
+def undefined_symbol(tree):
+    kind = tree[0]
+    if kind == SYM:
+        return tree[1]
+    if kind == NEG:
+        return undefined_symbol(tree[1])
+    if kind in (NUM, LOC):
+        return None
+    return undefined_symbol(tree[1]) or undefined_symbol(tree[2])
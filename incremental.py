@@ -0,0 +1,153 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import time
+from sicas import *
+
+# class to reassemble a source file after edits, the previous Program is kept and
+# only the edited statements are re-encoded as long as the layout is unchanged,
+# any edit which moves a location or a symbol falls back to a full assemble
+class Incremental:
+    def __init__(self, source):
+        self.source = source
+        self.program = None
+        self.texts = None
+        self.statements = None
+        self.full_runs = 0
+        self.partial_runs = 0
+        self.reencoded = 0
+
+    # (re)assemble the source, return the up-to-date Program
+    def assemble(self):
+        with open(self.source, "r") as f:
+            texts = [text.rstrip('\r\n') for text in f]
+        if self.program is None or not self.reencode(texts):
+            self.full(texts)
+        return self.program
+
+    def full(self, texts):
+        self.program = None
+        program = Program(self.source)
+        program.assemble()
+        # the statements assembled from each source line, an invocation is
+        # followed by its expansion and a macro definition has none
+        statements = {}
+        for line in program.content:
+            statements.setdefault(line.lineno, []).append(line)
+        self.program = program
+        self.texts = texts
+        self.statements = statements
+        self.full_runs += 1
+
+    # re-encode the statements edited in place, return False if a full assemble is needed
+    def reencode(self, texts):
+        program = self.program
+        if len(texts) != len(self.texts):
+            return False
+        edited = [(lineno, text) for lineno, (text, text_old) in enumerate(zip(texts, self.texts), 1) if text != text_old]
+        updates = []
+        for lineno, text in edited:
+            # a line of a macro definition or an invocation changes the expansions
+            lines = self.statements.get(lineno, ())
+            if len(lines) != 1 or lines[0].src != self.texts[lineno - 1]:
+                return False
+            line = lines[0]
+            line_new = Line(text, lineno)
+            # only the comment changed
+            if line_new.assembly == line.assembly:
+                updates.append((line, line_new))
+                continue
+            stmt_old = line.tokenize()
+            stmt_new = line_new.tokenize()
+            # a statement which defines a symbol must keep it, it stays at the same location
+            if line.code == "" or stmt_old[1] != stmt_new[1]:
+                return False
+            # literals are placed by the pools, let a full assemble lay them out
+            if stmt_old[4] == '=' or stmt_new[4] == '=':
+                return False
+            if not (stmt_new[2] in OPTAB or stmt_new[2] in ("BYTE", "WORD")) or program.macros.lookup(stmt_new[2]):
+                return False
+            try:
+                if not self.encode(line, line_new, stmt_new):
+                    return False
+            except AssembleError:
+                # the state is partially updated, start over on the next run
+                self.program = None
+                raise
+            updates.append((line, line_new))
+        for line, line_new in updates:
+            line.src = line_new.src
+            line.code = line_new.code
+            line.extended = line_new.extended
+            if len(line.src) > program.width:
+                program.width = len(line.src)
+        self.texts = texts
+        self.partial_runs += 1
+        self.reencoded += len(updates)
+        return True
+
+    # encode line_new at the location of line, return False if its size changed
+    # or it refers to a symbol not yet defined
+    def encode(self, line, line_new, stmt):
+        program = self.program
+        line_new.loc = line.loc
+        line_new.base = line.base
+        program.current = line_new
+        program.lineno = line_new.lineno
+        end, base = program.LOCCTR, program.base
+        program.LOCCTR = line.loc
+        program.base = line.base
+        # the M records of the old statement, the new one writes its own
+        for addr in range(line.loc, line.loc + line.fmt):
+            program.relocations.pop(addr, None)
+        try:
+            if stmt[2] in OPTAB:
+                # the label is already defined at this location
+                has_instructions(program, (stmt[0], None) + stmt[2:])
+            else:
+                has_directives(program, stmt)
+            size = program.LOCCTR - line.loc
+        finally:
+            program.LOCCTR = end
+            program.base = base
+        return size == line.fmt and line_new.fmt == line.fmt and not program.fixups
+
+if __name__ == "__main__":
+    # Parse the arguments
+    parser = argparse.ArgumentParser(description="Reassemble a SIC/XE source whenever it is edited")
+    parser.add_argument('-o', '--output', help='the output file.', default='a.out')
+    parser.add_argument('-L', '--listing', help='generate assembly listing.')
+    parser.add_argument('-i', '--interval', type=float, default=0.5, help='seconds between checks of the source.')
+    parser.add_argument('input', help='the source assembly file.')
+    args = parser.parse_args()
+
+    incremental = Incremental(args.input)
+    mtime = None
+    failed = False
+    try:
+        while True:
+            try:
+                current = os.stat(args.input).st_mtime_ns
+                if current != mtime:
+                    mtime = current
+                    try:
+                        full_runs = incremental.full_runs
+                        program = incremental.assemble()
+                        if args.listing:
+                            program.listing(args.listing)
+                        program.output(args.output)
+                        print("%s assembled (%s)." % (args.input, "full" if incremental.full_runs != full_runs else "incremental"))
+                    except AssembleError:
+                        print("Assemble failed.")
+                failed = False
+            # an editor may replace the source while saving it, or the output
+            # may be busy, try again on the next check
+            except OSError as e:
+                mtime = None
+                if not failed:
+                    print("Cannot access %s: %s, retrying." % (e.filename or args.input, e.strerror))
+                failed = True
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+import argparse
+import mmap
+import sys
+
+# A class to indicate linking error
+class LinkError(Exception):
+    pass
+
+# class to store info of each object file being linked, an object file with
+# several control sections gives a Module per section
+class Module:
+    def __init__(self, filename, address=None, section=0):
+        self.filename = filename
+        self.section = section
+        self.address = address
+        self.name = ''
+        self.start = 0
+        self.length = 0
+        self.entry = None
+
+    # the offset added to the addresses of the object file
+    def offset(self):
+        return self.address - self.start
+
+def parse_object_arg(text):
+    if '@' in text:
+        filename, address = text.rsplit('@', 1)
+        return Module(filename, int(address, 16))
+    return Module(text)
+
+# pass 1: lay out the modules one after another from base unless an address is
+# given, and build the external symbol table of program names and D records
+# the control sections after the first of a file are added to modules
+def layout(modules, base=0):
+    estab = {}
+    addr = base
+    sections = []
+    for module in modules:
+        with open(module.filename, "r") as f:
+            for record in f:
+                kind = record[:1]
+                if kind == 'H':
+                    if module.name:
+                        addr = max(addr, module.address + module.length)
+                        module = Module(module.filename, None, module.section + 1)
+                    sections.append(module)
+                    module.name = record[1:7].strip()
+                    module.start = int(record[7:13], 16)
+                    module.length = int(record[13:19], 16)
+                    if module.address is None:
+                        module.address = addr
+                    if module.name in estab:
+                        raise LinkError("duplicate program name %s in %s." % (module.name, module.filename))
+                    estab[module.name] = module.address
+                elif kind == 'D':
+                    record = record.rstrip('\n')
+                    for i in range(1, len(record), 12):
+                        name = record[i:i + 6].strip()
+                        if name in estab:
+                            raise LinkError("duplicate external symbol %s in %s." % (name, module.filename))
+                        estab[name] = int(record[i + 6:i + 12], 16) + module.offset()
+                elif kind == 'E' and len(record.strip()) > 1:
+                    module.entry = int(record[1:7], 16) + module.offset()
+        addr = max(addr, module.address + module.length)
+    modules[:] = sections
+    return estab
+
+# the size bytes at addr of a T or M record of module must be in the module,
+# and in the image once moved by offset
+def check_bounds(module, kind, addr, size, offset, image):
+    if addr < module.start or addr + size > module.start + module.length or addr + offset < 0 or addr + offset + size > len(image):
+        raise LinkError("%s record at %06X is outside of %s in %s." % (kind, addr, module.name, module.filename))
+
+# pass 2: copy the text records into the image and apply the modification records,
+# image covers the addresses from base; each object file is read once, the
+# modules of its control sections follow the module of its first one
+def load(modules, estab, image, base=0):
+    for first, module in enumerate(modules):
+        if module.section != 0:
+            continue
+        section = -1
+        with open(module.filename, "r") as f:
+            for record in f:
+                kind = record[:1]
+                if kind == 'H':
+                    section += 1
+                    module = modules[first + section]
+                    offset = module.offset() - base
+                elif kind == 'T':
+                    addr = int(record[1:7], 16)
+                    length = int(record[7:9], 16)
+                    check_bounds(module, kind, addr, length, offset, image)
+                    addr += offset
+                    image[addr:addr + length] = bytes.fromhex(record[9:9 + length * 2])
+                elif kind == 'M':
+                    record = record.rstrip('\n')
+                    addr = int(record[1:7], 16)
+                    halfbytes = int(record[7:9], 16)
+                    size = (halfbytes + 1) // 2
+                    check_bounds(module, kind, addr, size, offset, image)
+                    addr += offset
+                    # M records without a symbol relocate by the load address of the module
+                    if len(record) > 9:
+                        symbol = record[10:].strip()
+                        if symbol not in estab:
+                            raise LinkError("undefined external symbol %s in %s." % (symbol, module.filename))
+                        delta = estab[symbol]
+                        if record[9] == '-':
+                            delta = -delta
+                    else:
+                        delta = module.offset()
+                    mask = (1 << (halfbytes * 4)) - 1
+                    value = int.from_bytes(image[addr:addr + size], "big")
+                    value = (value & ~mask) | ((value + delta) & mask)
+                    image[addr:addr + size] = value.to_bytes(size, "big")
+
+# link the object files into a flat image written to output, return the entry point
+def link(modules, output, base=0, use_mmap=False):
+    estab = layout(modules, base)
+    for module in modules:
+        if module.address < base:
+            raise LinkError("%s is loaded below the base address." % module.name)
+    end = max([module.address + module.length for module in modules] + [base])
+    size = end - base
+    if use_mmap and size > 0:
+        with open(output, "w+b") as f:
+            f.truncate(size)
+            with mmap.mmap(f.fileno(), size) as image:
+                load(modules, estab, image, base)
+    else:
+        image = bytearray(size)
+        load(modules, estab, image, base)
+        with open(output, "wb") as f:
+            f.write(image)
+    entries = [module.entry for module in modules if module.entry is not None]
+    return entries[0] if entries else base
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A SIC/XE linking loader")
+    parser.add_argument('-o', '--output', help='the image file.', default='a.img')
+    parser.add_argument('-b', '--base', type=lambda x: int(x, 16), default=0, help='hex address of the image (default: 0).')
+    parser.add_argument('-m', '--mmap', action='store_true', help='write the image through mmap.')
+    parser.add_argument('input', nargs='+', help='the object files, FILE@ADDR loads FILE at hex address ADDR.')
+    args = parser.parse_args()
+
+    modules = [parse_object_arg(text) for text in args.input]
+    try:
+        entry = link(modules, args.output, args.base, args.mmap)
+    except (LinkError, OSError) as e:
+        print("Error : %s" % e)
+        sys.exit(1)
+    print("%-8s%-8s%-8s%s" % ("Program", "Address", "Length", "File"))
+    for module in modules:
+        print("%-8s%06X  %06X  %s" % (module.name, module.address, module.length, module.filename))
+    print("Entry point %06X" % entry)
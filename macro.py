@@ -0,0 +1,220 @@
+# macro processor working on the text of source statements
+#
+#   RDBUFF  MACRO   &INDEV,&BUFADR,&LENGTH=LENGTH
+#   $LOOP   TD      =X'&INDEV'
+#           ...
+#           MEND
+#
+# parameters are referred as &NAME and may have a default, an invocation
+# gives the arguments by position or as NAME=value, and labels beginning
+# with $ are made unique in each expansion
+import os
+import re
+import threading
+from collections import OrderedDict
+
+PARAMETER = re.compile(r"&([A-Za-z][A-Za-z0-9_]*)")
+KEYWORD_ARG = re.compile(r"([A-Za-z][A-Za-z0-9_]*)=(.*)$")
+# a quoted constant, a comment or the $ of a unique label
+UNIQUE_LABEL = re.compile(r"'[^']*'|\..*|\$")
+
+# the expansions kept per macro and the libraries kept open per process, the
+# least recently used is dropped beyond them
+MAX_EXPANSIONS = 64
+MAX_LIBRARIES = 16
+# the libraries, their macros and the expansions are shared by the programs
+# assembled in the threads of a process, and only updated holding this lock
+CACHE_LOCK = threading.Lock()
+
+# A class to indicate an invalid macro definition or invocation
+class MacroError(Exception):
+    pass
+
+# class of a macro definition, the expansions of the last MAX_EXPANSIONS
+# distinct arguments are memoized
+class Macro:
+    __slots__ = ('name', 'params', 'defaults', 'body', 'expansions', 'unique_labels')
+
+    def __init__(self, name, prototype, body):
+        self.name = name
+        self.params = []
+        self.defaults = {}
+        for param in prototype.split(',') if prototype else []:
+            param, equal, default = param.partition('=')
+            if param[:1] != '&' or not PARAMETER.fullmatch(param):
+                raise MacroError("Invalid parameter \"%s\" of macro %s." % (param, name))
+            self.params.append(param[1:])
+            self.defaults[param[1:]] = default
+        for text in body:
+            if split_statement(text)[1] in ("MACRO", "MEND"):
+                raise MacroError("Nested macro definition in macro %s." % name)
+        self.body = body
+        self.expansions = OrderedDict()
+        self.unique_labels = any('$' in text for text in body)
+
+    # bind the arguments of an invocation to the parameters
+    def bind(self, args):
+        values = dict(self.defaults)
+        position = 0
+        for arg in args:
+            keyword = KEYWORD_ARG.match(arg)
+            if keyword and keyword.group(1) in values:
+                values[keyword.group(1)] = keyword.group(2)
+                continue
+            if position == len(self.params):
+                raise MacroError("Too many arguments for macro %s." % self.name)
+            if arg:
+                values[self.params[position]] = arg
+            position += 1
+        return values
+
+    # the statements of the expansion with the given arguments
+    def expand(self, args):
+        key = tuple(args)
+        with CACHE_LOCK:
+            expansion = self.expansions.get(key)
+            if expansion is not None:
+                self.expansions.move_to_end(key)
+                return expansion
+        values = self.bind(args)
+
+        def substitute(match):
+            value = values.get(match.group(1))
+            if value is None:
+                raise MacroError("Undefined parameter &%s in macro %s." % (match.group(1), self.name))
+            return value
+        expansion = [PARAMETER.sub(substitute, text) for text in self.body]
+        with CACHE_LOCK:
+            self.expansions[key] = expansion
+            if len(self.expansions) > MAX_EXPANSIONS:
+                self.expansions.popitem(last=False)
+        return expansion
+
+# split a statement into (label, mnemonic, operand), the label is "" if the
+# statement begins with a blank
+def split_statement(text):
+    assembly = text.partition('.')[0]
+    words = assembly.split()
+    if not words:
+        return ("", None, "")
+    if assembly[0] in " \t":
+        words.insert(0, "")
+    if len(words) == 1:
+        return (words[0], None, "")
+    return (words[0], words[1], words[-1] if len(words) > 2 else "")
+
+# class of a macro library, the definitions are indexed by name when the
+# library is opened and only read and parsed when first used
+class MacroLibrary:
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.macros = {}
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if b"MACRO" in line:
+                    words = line.partition(b'.')[0].split()
+                    if len(words) >= 2 and words[1] == b"MACRO" and not line[:1].isspace():
+                        self.index.setdefault(words[0].decode(), offset)
+                offset += len(line)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get(self, name):
+        with CACHE_LOCK:
+            macro = self.macros.get(name)
+            if macro is None and name in self.index:
+                with open(self.path, "rb") as f:
+                    f.seek(self.index[name])
+                    lines = (line.decode().rstrip('\r\n') for line in f)
+                    header = split_statement(next(lines))
+                    macro = self.macros[name] = Macro(name, header[2], read_body(lines, name))
+        return macro
+
+# the statements of a definition up to its MEND
+def read_body(lines, name):
+    body = []
+    for text in lines:
+        if split_statement(text)[1] == "MEND":
+            return body
+        body.append(text)
+    raise MacroError("Missing MEND of macro %s." % name)
+
+# the opened libraries are shared by the programs assembled in a process, a
+# library is opened again once the file is modified
+LIBRARIES = OrderedDict()
+
+def open_library(path):
+    signature = library_signature(path)
+    with CACHE_LOCK:
+        entry = LIBRARIES.get(path)
+        if entry is None or entry[0] != signature:
+            entry = LIBRARIES[path] = (signature, MacroLibrary(path))
+            if len(LIBRARIES) > MAX_LIBRARIES:
+                LIBRARIES.popitem(last=False)
+        LIBRARIES.move_to_end(path)
+    return entry[1]
+
+def library_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+# class to look up the macros of a program, those defined in the source
+# take precedence over the libraries
+class MacroProcessor:
+    def __init__(self, libraries=()):
+        self.libraries = [open_library(path) for path in libraries]
+        self.macros = {}
+        self.expanded = 0
+
+    # whether any macro may be invoked
+    def __bool__(self):
+        return bool(self.macros) or any(library.index for library in self.libraries)
+
+    def define(self, name, prototype, body):
+        if name in self.macros:
+            raise MacroError("Redefined macro %s." % name)
+        self.macros[name] = Macro(name, prototype, body)
+
+    def lookup(self, name):
+        macro = self.macros.get(name)
+        if macro is None:
+            for library in self.libraries:
+                if name in library:
+                    macro = self.macros[name] = library.get(name)
+                    break
+        return macro
+
+    # the statements of an invocation, the label of the invocation is put on
+    # the first statement, or defined by an EQU if that has a label already
+    def expand(self, macro, label, operand):
+        texts = macro.expand(operand.split(',') if operand else [])
+        self.expanded += 1
+        if macro.unique_labels:
+            suffix = "$" + unique_suffix(self.expanded)
+            texts = [unique_labels(text, suffix) for text in texts]
+        if label:
+            if texts and texts[0][:1] in (" ", "\t"):
+                texts = ["%-7s %s" % (label, texts[0].lstrip())] + texts[1:]
+            else:
+                texts = ["%-7s EQU     *" % label] + texts
+        return texts
+
+# replace the $ of the labels of text by suffix, outside of the quoted
+# constants and the comment
+def unique_labels(text, suffix):
+    return UNIQUE_LABEL.sub(lambda match: suffix if match.group() == '$' else match.group(), text)
+
+# AA, AB, ... for the labels of each expansion
+def unique_suffix(count):
+    letters = ""
+    count -= 1
+    for i in range(2):
+        letters = chr(ord('A') + count % 26) + letters
+        count //= 26
+    while count:
+        letters = chr(ord('A') + count % 26) + letters
+        count //= 26
+    return letters
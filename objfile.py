@@ -0,0 +1,219 @@
+#!/usr/bin/python
+
+# random access to the text object files written by sicas.py, the file is
+# mapped and a record is only decoded when it is used
+#
+#   with ObjectFile("copy.obj") as obj:
+#       code = obj.read(0x1000, 3)
+#
+# the first lookup scans the lines once to index the text records of each
+# control section by address, and a lookup is a bisect in the index
+import argparse
+import binascii
+import bisect
+import mmap
+import os
+import sys
+from array import array
+
+# A class to indicate an invalid object file
+class ObjectFileError(Exception):
+    pass
+
+# class of a control section, the text records are indexed by their start
+# address, with their end address and the offset of the record in the file
+class Section:
+    __slots__ = ('obj', 'name', 'start', 'length', 'entry', 'begin', 'end', 'starts', 'ends', 'offsets')
+
+    def __init__(self, obj, record, begin):
+        self.obj = obj
+        self.name = bytes(record[1:7]).decode().rstrip()
+        self.start = parse_hex(record, 7, 13)
+        self.length = parse_hex(record, 13, 19)
+        self.entry = None
+        self.begin = begin
+        self.end = begin
+        self.starts = array('l')
+        self.ends = array('l')
+        self.offsets = array('q')
+
+    # the records of the section, as memoryviews of the file
+    def records(self):
+        return self.obj.records(self.begin, self.end)
+
+    # (address, code) of each text record, code is decoded when it is reached
+    def text_records(self):
+        view = self.obj.view
+        for addr, end, offset in zip(self.starts, self.ends, self.offsets):
+            yield (addr, binascii.unhexlify(view[offset + 9:offset + 9 + (end - addr) * 2]))
+
+    # (address, half-bytes, "+SYMBOL", "-SYMBOL" or "") of each M record
+    def modifications(self):
+        for record in self.records():
+            if record[0] == ord('M'):
+                yield (parse_hex(record, 1, 7), parse_hex(record, 7, 9), bytes(record[9:]).decode().rstrip())
+
+    # the index of the text record holding addr, -1 if it is not in a record
+    def find(self, addr):
+        i = bisect.bisect_right(self.starts, addr) - 1
+        if i >= 0 and addr < self.ends[i]:
+            return i
+        return -1
+
+    # the bytes from addr, those not in a text record (reserved space) are 0,
+    # they must be in the section
+    def read(self, addr, size=1):
+        if size < 0 or addr < self.start or addr + size > self.start + self.length:
+            raise ObjectFileError("%06X-%06X is outside of section %s (%06X-%06X)." % (addr, addr + size, self.name, self.start, self.start + self.length))
+        data = bytearray(size)
+        view = self.obj.view
+        stop = addr + size
+        i = max(bisect.bisect_right(self.starts, addr) - 1, 0)
+        while i < len(self.starts) and self.starts[i] < stop:
+            lo = max(addr, self.starts[i])
+            hi = min(stop, self.ends[i])
+            if lo < hi:
+                offset = self.offsets[i] + 9 + (lo - self.starts[i]) * 2
+                data[lo - addr:hi - addr] = binascii.unhexlify(view[offset:offset + (hi - lo) * 2])
+            i += 1
+        return bytes(data)
+
+    # whether addr is in a text record
+    def __contains__(self, addr):
+        return self.find(addr) >= 0
+
+    # sort the index if the records are not in address order
+    def seal(self, end):
+        self.end = end
+        if any(self.starts[i] > self.starts[i + 1] for i in range(len(self.starts) - 1)):
+            order = sorted(range(len(self.starts)), key=self.starts.__getitem__)
+            self.starts = array('l', [self.starts[i] for i in order])
+            self.ends = array('l', [self.ends[i] for i in order])
+            self.offsets = array('q', [self.offsets[i] for i in order])
+
+def parse_hex(record, begin, end):
+    try:
+        return int(bytes(record[begin:end]), 16)
+    except ValueError:
+        raise ObjectFileError("Invalid record %s." % bytes(record).decode(errors="replace").rstrip())
+
+# class of a mapped text object file, the sections are indexed on first use
+class ObjectFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.map = None
+        self.view = memoryview(self.map if self.map is not None else b"")
+        self.index = None
+
+    def close(self):
+        self.index = None
+        self.view.release()
+        if self.map is not None:
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # (offset, record) of each non-empty line from begin to end, the records are
+    # memoryviews of the file without the line end
+    def lines(self, begin=0, end=None):
+        data = self.map if self.map is not None else b""
+        view = self.view
+        if end is None:
+            end = len(view)
+        pos = begin
+        while pos < end:
+            stop = data.find(b"\n", pos, end)
+            if stop < 0:
+                stop = end
+            line_end = stop - 1 if stop > pos and view[stop - 1] == 13 else stop
+            if line_end > pos:
+                yield (pos, view[pos:line_end])
+            pos = stop + 1
+
+    def records(self, begin=0, end=None):
+        for offset, record in self.lines(begin, end):
+            yield record
+
+    # the control sections, indexed by the first call
+    @property
+    def sections(self):
+        if self.index is None:
+            self.index = self.build_index()
+        return self.index
+
+    def build_index(self):
+        sections = []
+        section = None
+        T, H, E = ord('T'), ord('H'), ord('E')
+        for offset, record in self.lines():
+            kind = record[0]
+            if kind == H:
+                if section is not None:
+                    section.seal(offset)
+                section = Section(self, record, offset)
+                sections.append(section)
+            elif section is None:
+                raise ObjectFileError("%s does not begin with an H record." % self.path)
+            elif kind == T:
+                addr = parse_hex(record, 1, 7)
+                size = parse_hex(record, 7, 9)
+                if len(record) < 9 + size * 2:
+                    raise ObjectFileError("Truncated text record at %06X." % addr)
+                section.starts.append(addr)
+                section.ends.append(addr + size)
+                section.offsets.append(offset)
+            elif kind == E and len(record) > 1:
+                section.entry = parse_hex(record, 1, 7)
+        if section is not None:
+            section.seal(len(self.view))
+        return sections
+
+    # the section named name, or the n-th one if name is an int
+    def section(self, name=0):
+        if isinstance(name, int):
+            return self.sections[name]
+        for section in self.sections:
+            if section.name == name:
+                return section
+        raise KeyError(name)
+
+    # the bytes from addr in a section, the first one by default
+    def read(self, addr, size=1, section=0):
+        return self.section(section).read(addr, size)
+
+    def modifications(self):
+        for section in self.sections:
+            yield from section.modifications()
+
+    @property
+    def entry(self):
+        if self.sections:
+            return self.sections[0].entry
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read the bytes at an address of a SIC/XE object file")
+    parser.add_argument('-n', '--size', type=int, default=3, help='number of bytes (default: 3).')
+    parser.add_argument('-s', '--section', help='the control section (default: the first).')
+    parser.add_argument('input', help='the object file.')
+    parser.add_argument('address', type=lambda x: int(x, 16), help='hex address.')
+    args = parser.parse_args()
+
+    try:
+        with ObjectFile(args.input) as obj:
+            section = obj.section(args.section or 0)
+            print("%s %06X %s" % (section.name, args.address, section.read(args.address, args.size).hex().upper()))
+    except (ObjectFileError, OSError) as e:
+        print("Error : %s" % e)
+        sys.exit(1)
+    except (KeyError, IndexError):
+        print("Error : no control section %s." % (args.section or 0))
+        sys.exit(1)
@@ -1,51 +1,418 @@
 #!/usr/bin/python
 
 import argparse
+import contextlib
+import io
+import json
 import os
+import re
+import sys
+import time
+import concurrent.futures
 from sicxe import *
+from cache import Cache, DEFAULT_MAX_SIZE
+from expression import ExpressionError, NUM, parse, fold, undefined_symbol
+from macro import MacroError, MacroProcessor, split_statement, library_signature
+from binobj import text_to_binary
 
-# A class to indicate assembly error
+VERSION = "1.9"
+
+# the characters read at a time when scanning a source file
+SCAN_SIZE = 1 << 16
+
+# A class to indicate assembly error, carrying the Diagnostic
 class AssembleError(BaseException):
     pass
 
-# class to store info of each source statements
+# class to store an error found in a source statement, column counts from 1
+# and code names the kind of error
+class Diagnostic:
+    __slots__ = ('source', 'lineno', 'column', 'code', 'statement', 'message')
+
+    def __init__(self, source, lineno, statement, message, column=1, code="syntax"):
+        self.source = source
+        self.lineno = lineno
+        self.column = column
+        self.code = code
+        self.statement = statement
+        self.message = message
+
+    def __str__(self):
+        return "\n%s:%s:%s  %s\nError : %s [%s]\n" % (self.source, self.lineno, self.column, self.statement, self.message, self.code)
+
+    def as_dict(self):
+        return {"source": self.source, "lineno": self.lineno, "column": self.column, "code": self.code, "statement": self.statement, "message": self.message}
+
+# the column of token in the statement, or of the statement if it is not found
+def error_column(statement, token):
+    if token:
+        match = re.search(r"(?<![\w$])%s(?![\w$])" % re.escape(token), statement)
+        if match:
+            return match.start() + 1
+    return len(statement) - len(statement.lstrip()) + 1
+
+# class to store info of each source statements, the statement without
+# comment is derived from src on demand and litpool is only allocated by LTORG,
+# index numbers the statements assembled, macro expansions included
 class Line:
-    def __init__(self, assembly, lineno):
-        self.src = assembly
-        self.assembly = assembly.split('.')[0]
+    __slots__ = ('src', 'code', 'lineno', 'fmt', 'extended', 'loc', 'base', 'litpool', 'index')
+
+    def __init__(self, src, lineno):
+        self.src = src
         self.code = ""
         self.lineno = lineno
         self.fmt = 0
+        # a format 4 instruction, a 4-byte constant has fmt 4 as well
+        self.extended = False
         self.loc = None
         self.base = -1
-        self.litpool = []
-    
+        self.litpool = ()
+
+    @property
+    def assembly(self):
+        return self.src.partition('.')[0]
+
     def __str__(self):
         return self.assembly
 
     def __repr__(self):
         return str(self)
 
-    # split the source statement into several tokens
+    # split the source statement into label, mnemonic and operands
     def tokenize(self):
-        return self.assembly.split()
+        return lex(self.assembly)
 
     # return a tuple for assembly listing
     def listing_tuple(self):
         locfmt = ""
         codefmt = ""
-        if self.loc != None:
+        if self.loc != None and not self.litpool:
             locfmt = "%04X" % self.loc
         if self.code != "":
-            codefmt = "%%0%dX" % (self.fmt * 2)
-            codefmt = codefmt % self.code
-        if any(self.litpool):
-            locfmt = ""
+            codefmt = "%0*X" % (self.fmt * 2, self.code)
         return (self.lineno, locfmt, self.src.expandtabs(8), codefmt)
 
+# return a tuple for assembly listing of a literal pool entry
+def literal_tuple(lit):
+    return ("", "%04X" % lit[0], "*       " + lit[1], "%0*X" % (lit[3] * 2, lit[2]))
+
+# listing tuples of statements and the literal pools placed by them
+def listing_rows(lines):
+    rows = []
+    for line in lines:
+        rows.append(line.listing_tuple())
+        if line.litpool:
+            rows.extend([literal_tuple(lit) for lit in line.litpool])
+    return rows
+
+# class to write the assembly listing as aligned text, tab separated values or
+# JSON lines, the statements queued are written once their object code is final
+class Listing:
+    FORMATS = ("text", "tsv", "json")
+    DEFAULT_WIDTH = 40
+    BATCH = 1024
+
+    def __init__(self, f, width=None, fmt="text"):
+        self.f = f
+        self.fmt = fmt
+        self.queue = []
+        if fmt == "text":
+            self.rowfmt = "\n%%-8s%%-8s%%-%ds%%-10s" % (width or Listing.DEFAULT_WIDTH)
+            f.write(self.rowfmt % ("Lineno", "LOCCTR", "Source Statements", "Object Code"))
+        elif fmt == "tsv":
+            f.write("lineno\tloc\tsource\tcode\n")
+
+    def rows(self, rows):
+        if self.fmt == "text":
+            rowfmt = self.rowfmt
+            self.f.write("".join([rowfmt % row for row in rows]))
+        elif self.fmt == "tsv":
+            self.f.write("".join(["%s\t%s\t%s\t%s\n" % row for row in rows]))
+        else:
+            self.f.write("".join([json.dumps({"lineno": row[0] or None, "loc": row[1] or None, "source": row[2], "code": row[3] or None}) + "\n" for row in rows]))
+
+    # write statements and the literal pools placed by them
+    def write(self, lines):
+        self.rows(listing_rows(lines))
+
+    def write_literals(self, pool):
+        self.rows([literal_tuple(lit) for lit in pool])
+
+    def flush(self):
+        self.write(self.queue)
+        self.queue = []
+
+# a lexed source statement is the tuple
+#   (tokens, label, mnemonic, format prefix, addressing prefix, operands)
+# label and mnemonic are None if absent, prefixes are "" if absent
+EMPTY_OPERANDS = ()
+
+# an instruction with a prefix not in KEYWORDS, reported by has_instructions
+def prefixed_keyword(token):
+    if token[1:] in OPTAB:
+        return (token[1:], token[0])
+    return None
+
+# classify the tokens of a statement in one pass, the mnemonic is either the
+# first token or the one following the label, and may carry a format prefix
+def lex(text):
+    tokens = text.split()
+    ntokens = len(tokens)
+    if ntokens == 0:
+        return (tokens, None, None, "", "", EMPTY_OPERANDS)
+    label = None
+    idx = 0
+    keyword = KEYWORDS.get(tokens[0]) or prefixed_keyword(tokens[0])
+    if keyword is None:
+        label = sys.intern(tokens[0])
+        if ntokens == 1:
+            return (tokens, label, None, "", "", EMPTY_OPERANDS)
+        idx = 1
+        keyword = KEYWORDS.get(tokens[1]) or prefixed_keyword(tokens[1]) or (tokens[1], "")
+    # only the last token is taken as operand(s)
+    if ntokens == idx + 1:
+        return (tokens, label, keyword[0], keyword[1], "", EMPTY_OPERANDS)
+    operand = tokens[-1]
+    prefix = ""
+    if operand[0] in "#@=":
+        prefix = operand[0]
+        operand = operand[1:]
+    return (tokens, label, keyword[0], keyword[1], prefix, operand.split(','))
+
+# encode a C'...' or X'...' constant as (code, size in bytes), the encodings
+# are shared by every reference to the same constant in the program
+def encode_constant(program, value):
+    encoded = program.constants.get(value)
+    if encoded is not None:
+        return encoded
+    if len(value) < 3 or value[1] != "'" or value[-1] != "'":
+        program.error("Unmatched quotation marks in %s." % value, code="constant", token=value)
+    text = value[2:-1]
+    if value[0] == 'C':
+        data = text.encode()
+        encoded = (int.from_bytes(data, "big"), len(data))
+    elif value[0] == 'X':
+        try:
+            encoded = (int(text, 16), (len(text) + 1) // 2)
+        except ValueError:
+            program.error("The \"X\" requires a hex value, but %s is not." % text, code="constant", token=value)
+    else:
+        program.error("Unrecognized constant %s." % value, code="constant", token=value)
+    if not encoded[1]:
+        program.error("Empty constant %s." % value, code="constant", token=value)
+    program.constants[value] = encoded
+    return encoded
+
+# read the source statements one at a time
+def read_source(f):
+    with f:
+        yield from read_lines(f)
+
+def read_lines(lines, first_lineno=1):
+    for lineno, line in enumerate(lines, first_lineno):
+        yield Line(line.rstrip('\r\n'), lineno)
+
+# expand the macros in the source statements before they are assembled, the
+# definitions are consumed, and an invocation is kept as a comment followed
+# by its expansion, which is numbered as the invocation
+def expand_macros(program, stream):
+    macros = program.macros
+    active = bool(macros)
+    for line in stream:
+        try:
+            if "MACRO" in line.src:
+                label, mnemonic, operand = split_statement(line.src)
+                if mnemonic == "MACRO":
+                    define_macro(program, line, label, operand, stream)
+                    active = True
+                    continue
+            if active:
+                yield from expand_line(program, line, 0)
+            else:
+                yield line
+        # the statement in error is dropped when all the errors are collected
+        except AssembleError:
+            if not program.all_errors:
+                raise
+
+def define_macro(program, line, name, prototype, stream):
+    body = []
+    for body_line in stream:
+        if split_statement(body_line.src)[1] == "MEND":
+            break
+        body.append(body_line.src)
+    else:
+        program.error("Missing MEND of macro %s." % name, line, "macro")
+    try:
+        program.macros.define(name, prototype, body)
+    except MacroError as e:
+        program.error(str(e), line, "macro")
+
+# a macro invoked in an expansion is expanded in turn
+MAX_MACRO_DEPTH = 20
+
+def expand_line(program, line, depth):
+    label, mnemonic, operand = split_statement(line.src)
+    macro = mnemonic and program.macros.lookup(mnemonic)
+    # an invocation without a label may begin in the first column
+    if not macro and label:
+        macro = program.macros.lookup(label)
+        if macro:
+            label, operand = ("", mnemonic or "")
+    if not macro:
+        yield line
+        return
+    if depth == MAX_MACRO_DEPTH:
+        program.error("Macro %s is expanded too deeply." % macro.name, line, "macro")
+    yield Line("." + line.src, line.lineno)
+    try:
+        texts = program.macros.expand(macro, label, operand)
+    except MacroError as e:
+        program.error(str(e), line, "macro")
+    for text in texts:
+        yield from expand_line(program, Line(text, line.lineno), depth + 1)
+
+# loads of an immediate 0 which CLEAR the register in format 2
+CLEAR_LOADS = {"LDA": "A", "LDX": "X", "LDL": "L", "LDB": "B", "LDS": "S", "LDT": "T"}
+# the load which reads back what a store has written
+STORE_LOADS = {"STA": "LDA", "STX": "LDX", "STL": "LDL", "STB": "LDB", "STS": "LDS", "STT": "LDT", "STF": "LDF", "STCH": "LDCH"}
+JUMPS = frozenset(["J", "JEQ", "JGT", "JLT"])
+# statements whose label is the location of the statement
+LOCATED = frozenset(["BYTE", "WORD", "RESB", "RESW"])
+
+# rewrite the statements after the macros are expanded and before they are
+# assembled, a rewritten statement notes the original in its comment and a
+# removed one is kept as a comment so the listing shows what was done
+#   LDA #0      -> CLEAR A
+#   +LDA #100   -> LDA #100, an immediate which fits format 3
+#   J NEXT      -> removed if NEXT labels the next statement
+#   STA BUF     -> LDA BUF is removed after it unless it has a label
+def peephole(program, stream):
+    held = []
+    stored = None
+    for line in stream:
+        tokens, label, inst, extended, prefix, operands = line.tokenize()
+        if not tokens:
+            if held:
+                held.append(line)
+            else:
+                yield line
+            continue
+        # a jump held until the statement after it is known
+        if held:
+            jump = held[0].tokenize()
+            if label is not None and label == jump[5][0] and (inst in OPTAB or inst in LOCATED):
+                held[0] = peephole_remove(program, held[0], jump)
+            yield from held
+            held = []
+        if inst not in OPTAB:
+            stored = None
+            yield line
+            continue
+        operand = prefix + ",".join(operands)
+        if stored == (inst, operand) and label is None:
+            yield peephole_remove(program, line, (tokens, label, inst, extended, prefix, operands))
+            continue
+        saved = 0
+        text = None
+        if extended == '+' and prefix == '#' and len(operands) == 1 and operands[0].isdigit() and int(operands[0]) < 4096:
+            extended = ""
+            saved = 1
+        if prefix == '#' and operands == ['0'] and inst in CLEAR_LOADS:
+            inst, operand = ("CLEAR", CLEAR_LOADS[inst])
+            saved += 1
+        if saved:
+            line = peephole_rewrite(program, line, tokens, "%-7s %-7s %s" % (label or "", extended + inst, operand), saved)
+        if inst in JUMPS and prefix == "" and len(operands) == 1 and not operands[0].isdigit() and EXPRESSION_CHARS.isdisjoint(operands[0]):
+            stored = None
+            held = [line]
+            continue
+        stored = (STORE_LOADS[inst], operand) if inst in STORE_LOADS and prefix == "" else None
+        yield line
+    yield from held
+
+def peephole_rewrite(program, line, tokens, text, saved):
+    program.stats.peephole_rewrites += 1
+    program.stats.peephole_saved += saved
+    return Line("%-24s . was: %s" % (text.rstrip(), " ".join(tokens)), line.lineno)
+
+# remove the instruction of line, its label still names the location
+def peephole_remove(program, line, stmt):
+    tokens, label, inst, extended = stmt[:4]
+    if label is not None:
+        return peephole_rewrite(program, line, tokens, "%-7s EQU     *" % label, 4 if extended else 3)
+    program.stats.peephole_rewrites += 1
+    program.stats.peephole_saved += 4 if extended else 3
+    return Line(". removed: %s" % " ".join(tokens), line.lineno)
+
+# class to store a reference waiting for a symbol to be defined
+class Fixup:
+    __slots__ = ('line', 'ref', 'reftype')
+
+    def __init__(self, line, ref, reftype):
+        self.line = line
+        self.ref = ref
+        self.reftype = reftype
+
+# class to store the time spent in each phase and counters of an assemble
+class Stats:
+    PHASES = ("read", "assemble", "end_litpool", "listing", "output")
+    COUNTERS = ("statements", "symbols", "forward_refs", "fill_forward", "fill_lit", "literals", "t_records", "m_records", "relax_passes", "relaxed", "relax_saved", "peephole_rewrites", "peephole_saved")
+    __slots__ = ('times',) + COUNTERS
+
+    def __init__(self):
+        self.times = dict.fromkeys(Stats.PHASES, 0.0)
+        for counter in Stats.COUNTERS:
+            setattr(self, counter, 0)
+
+    # add the times and counters of another assemble, of a control section,
+    # the sections are relaxed independently so only their passes are not added
+    def add(self, other):
+        relax_passes = max(self.relax_passes, other.relax_passes)
+        for phase in Stats.PHASES:
+            self.times[phase] += other.times[phase]
+        for counter in Stats.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        self.relax_passes = relax_passes
+
+    def as_dict(self):
+        return {"times": dict(self.times), "counts": {counter: getattr(self, counter) for counter in Stats.COUNTERS}}
+
+    # the names are aligned to the longest one
+    def report(self):
+        width = max(len(name) for name in Stats.PHASES + Stats.COUNTERS) + 1
+        lines = ["%-*s%10.4fs" % (width, phase, self.times[phase]) for phase in Stats.PHASES]
+        lines.append("%-*s%10.4fs" % (width, "total", sum(self.times.values())))
+        lines.extend("%-*s%10d" % (width, counter, getattr(self, counter)) for counter in Stats.COUNTERS)
+        return "\n".join(lines)
+
+# read the source statements, adding the time spent reading to stats
+def timed_source(stream, stats):
+    clock = time.perf_counter
+    times = stats.times
+    while True:
+        start = clock()
+        line = next(stream, None)
+        times["read"] += clock() - start
+        if line is None:
+            return
+        yield line
+
 # class to store each program info
 class Program:
-    def __init__(self, source):
+    # keep_source keeps every statement for the listing, otherwise only
+    # statements which produce object code are kept after assembling,
+    # if a Stats is given the time spent reading the source is measured too,
+    # if lines are given they are assembled instead of opening source,
+    # errors are only printed if echo is set, and the macros not defined in
+    # the source are looked up in the macro_libs files, first_lineno numbers
+    # the lines of a control section split from a source, if all_errors is set
+    # the assembly goes on with the next statement after an error and fails
+    # at the end with every error collected, if relax is set the statements
+    # overflowing format 3 are collected for the next pass of assemble_relaxed,
+    # which assembles the statements of promoted in format 4, and if optimize
+    # is set the statements are rewritten by peephole before they are assembled
+    def __init__(self, source, keep_source=True, stats=None, lines=None, echo=True, macro_libs=(), first_lineno=1, all_errors=False, relax=False, promoted=frozenset(), optimize=False):
         self.source = os.path.basename(source)
         self.name = ''
         self.start_addr = 0x0
@@ -53,150 +420,273 @@ class Program:
         self.started = False
         self.LOCCTR = 0
         self.lineno = 0
-        self.content = list(Line(line.strip('\n'), lineno) for lineno, line in enumerate(open(source, "r").readlines(), 1))
+        if lines is None:
+            self.stream = read_source(open(source, "r"))
+        else:
+            self.stream = read_lines(lines, first_lineno)
+        self.macros = MacroProcessor(macro_libs)
+        self.stream = expand_macros(self, self.stream)
+        if optimize:
+            self.stream = peephole(self, self.stream)
+        self.echo = echo
+        self.all_errors = all_errors
+        self.relax = relax
+        self.promoted = promoted
+        self.overflows = set()
+        self.short = 0
+        self.index = 0
+        self.diagnostics = []
+        self.stats = stats or Stats()
+        if stats is not None:
+            self.stream = timed_source(self.stream, stats)
+        self.keep_source = keep_source
+        self.content = []
+        self.current = None
         self.symtab = PRELOAD_SYMTAB.copy()
+        self.absolute = set(PRELOAD_SYMTAB)
+        self.expressions = {}
+        self.relocations = {}
+        self.extdefs = []
+        self.externals = {}
+        self.primary = True
+        self.org_return = None
+        self.highest = 0
+        self.resolving = None
+        self.fixups = {}
         self.littab = {}
+        self.literals = {}
+        self.constants = {}
         self.endlitpool = []
         self.base = -1
+        self.width = 0
 
-    # print error message indicating the line number and throw the error
-    def error(self, msg, line = None):
+    # record the error indicating the line number, print it and throw the error,
+    # token is the part of the statement which is wrong
+    def error(self, msg, line = None, code="syntax", token=None):
         if line == None:
             line = self.current_line()
-        print("\n%s:%s" % (self.source, str(line.lineno)) + "  " + str(line))
-        print("Error : " + msg + '\n')
-        raise AssembleError
+        statement = str(line)
+        diagnostic = Diagnostic(self.source, line.lineno, statement, msg, error_column(statement, token), code)
+        self.diagnostics.append(diagnostic)
+        if self.echo:
+            print(diagnostic)
+        raise AssembleError(diagnostic)
 
-    # assemble the program
-    def assemble(self):
-        for line in self.content:
-            program.lineno += 1
-            line.loc = self.LOCCTR
-            line.base = self.base
-            if line.assembly == '':
-                line.loc = None
-                continue
+    # report an error which does not stop the assembly when all the errors are
+    # collected
+    def report(self, msg, line, code="syntax", token=None):
+        try:
+            self.error(msg, line, code, token)
+        except AssembleError:
+            if not self.all_errors:
+                raise
+
+    # the displacement or value of the format fmt statement of line does not
+    # fit, when relaxing a format 3 statement is widened by the next pass
+    def overflow(self, line, fmt, msg, token=None):
+        if self.relax and fmt == 3:
+            self.overflows.add(line.index)
+        else:
+            self.error(msg, line, "range", token)
 
-            tokens = line.tokenize()
+    # after an error in the statement of line, skip the space of an instruction
+    # and define its label there, so the statements referring to it are not
+    # reported as well
+    def recover(self, line):
+        label, mnemonic, operand = split_statement(line.src)
+        mnemonic = (mnemonic or "").lstrip('+')
+        if self.LOCCTR == line.loc and mnemonic in OPTAB:
+            self.LOCCTR += 4 if "+" in line.src.split('.')[0] else OPTAB[mnemonic].fmt
+        if not label or label in KEYWORDS or label in self.symtab or label in self.externals:
+            return
+        if mnemonic in DIRTAB and mnemonic not in LABELLED_DIRECTIVES:
+            return
+        self.fixups.pop(label, None)
+        self.symtab[label] = self.LOCCTR if line.loc is None else line.loc
 
+    # assemble the program, the listing is written while assembling if given
+    def assemble(self, listing=None):
+        stats = self.stats
+        start = time.perf_counter()
+        elapsed = stats.times["read"] + stats.times["listing"] + stats.times["end_litpool"]
+        statements = 0
+        for line in self.stream:
+            self.current = line
             self.lineno = line.lineno
-            if has_directives(self, tokens):
-                continue
-            elif has_instructions(self, tokens):
-                continue
-            else:
-                program.error("Except a directive, opcde or label.")
+            self.index += 1
+            line.index = self.index
+            line.loc = self.LOCCTR
+            line.base = self.base
+            try:
+                stmt = line.tokenize()
+                if not stmt[0]:
+                    line.loc = None
+                else:
+                    statements += 1
+                    if not (has_directives(self, stmt) or has_instructions(self, stmt)):
+                        self.error("Except a directive, opcde or label.", token=stmt[2] or stmt[1])
+            except AssembleError:
+                if not self.all_errors:
+                    raise
+                self.recover(line)
+            # statements waiting for forward references are kept alive by the fixups
+            if self.keep_source or line.code != "" or any(line.litpool):
+                self.content.append(line)
+            if len(line.src) > self.width:
+                self.width = len(line.src)
+            # nothing refers forward, so every statement queued is final
+            if listing is not None:
+                listing.queue.append(line)
+                if len(listing.queue) >= Listing.BATCH and not self.fixups and not self.littab:
+                    flush_start = time.perf_counter()
+                    listing.flush()
+                    stats.times["listing"] += time.perf_counter() - flush_start
+        litpool_start = time.perf_counter()
         end_LITPOOL(self)
-        for k, v in self.symtab.items():
-            if type(v) == list:
-                program.error("Undefined symbol %s." % v)
-
-    # write assembly listing to file
-    def listing(self, filename):
-        stmt_len = len(max(self.content, key=lambda stmt: len(stmt.src)).src) + 10
-        fmt = "\n%%-8s%%-8s%%-%ds%%-10s" % stmt_len
+        stats.times["end_litpool"] += time.perf_counter() - litpool_start
+        stats.statements = statements
+        stats.symbols = len(self.symtab) - len(PRELOAD_SYMTAB)
+        for symbol, pending in self.fixups.items():
+            self.report("Undefined symbol %s." % symbol, pending[0].line, "undefined", symbol)
+        for symbol, line in self.extdefs:
+            if symbol not in self.symtab:
+                self.report("Undefined external definition %s." % symbol, line, "undefined", symbol)
+            elif symbol in self.absolute:
+                self.report("External definition %s must be an address." % symbol, line, "external", symbol)
+        if listing is not None:
+            flush_start = time.perf_counter()
+            listing.flush()
+            listing.write_literals(self.endlitpool)
+            stats.times["listing"] += time.perf_counter() - flush_start
+        if self.diagnostics:
+            raise AssembleError(self.diagnostics[0])
+        # the other phases measured in between are not part of assembling
+        elapsed = stats.times["read"] + stats.times["listing"] + stats.times["end_litpool"] - elapsed
+        stats.times["assemble"] += time.perf_counter() - start - elapsed
+
+    # write assembly listing to file after assembling
+    def listing(self, filename, width=None, fmt="text"):
+        start = time.perf_counter()
         with open(filename, "w") as f:
-            f.write(fmt % ("Lineno", "LOCCTR", "Source Statements", "Object Code"))
-            for line in self.content:
-                f.write(fmt % line.listing_tuple())
-                if any(line.litpool):
-                    for lit in line.litpool:
-                        code = lit[2]
-                        if lit[1][0] == 'C':
-                            code = "%%0%dX" % (len(lit[1]) - 3)
-                            code = code % lit[2]
-                        elif lit[1][0] == 'X':
-                            code = "%02X" % lit[2]
-                        f.write(fmt % ("", "%04X" % lit[0], "*\t".expandtabs(8) + lit[1], code))
-            for lit in self.endlitpool:
-                code = lit[2]
-                if lit[1][0] == 'C':
-                    code = "%%0%dX" % (len(lit[1]) - 3)
-                    code = code % lit[2]
-                elif lit[1][0] == 'X':
-                    code = "%02X" % lit[2]
-                f.write(fmt % ("", "%04X" % lit[0], "*\t".expandtabs(8) + lit[1], code))
+            listing = Listing(f, width or self.width + 10, fmt)
+            listing.write(self.content)
+            listing.write_literals(self.endlitpool)
+        self.stats.times["listing"] += time.perf_counter() - start
+
+    # listing tuples of the whole program after assembling
+    def listing_rows(self):
+        return listing_rows(self.content) + [literal_tuple(lit) for lit in self.endlitpool]
+
+    # evaluate the expression text at loc, return the folded tree, which is a
+    # (NUM, value, relative, externals) node if it is known, and the first symbol it is
+    # waiting for; the parsed tree is cached and only folded again once that
+    # symbol is defined
+    def evaluate(self, text, loc):
+        entry = self.expressions.get(text)
+        try:
+            if entry is None or (entry[1] is not None and entry[1] in self.symtab):
+                tree = parse(text) if entry is None else entry[0]
+                tree = fold(tree, self.symtab, self.absolute, externals=self.externals)
+                entry = self.expressions[text] = (tree, undefined_symbol(tree))
+            tree, missing = entry
+            if tree[0] != NUM:
+                tree = fold(tree, self.symtab, self.absolute, loc)
+        except ExpressionError as e:
+            self.error(str(e), code="expression", token=text)
+        return (tree, missing)
+
+    # define a symbol and resolve the references waiting for it
+    # the references are resolved in a loop since an EQU resolved may define
+    # another symbol in turn
+    def define(self, symbol, addr):
+        self.symtab[symbol] = addr
+        pending = self.fixups.pop(symbol, None)
+        if pending is None:
+            return
+        if self.resolving is not None:
+            self.resolving.append((pending, addr))
+            return
+        self.resolving = [(pending, addr)]
+        try:
+            while self.resolving:
+                pending, addr = self.resolving.pop()
+                fill_forward(pending, addr, self)
+        finally:
+            self.resolving = None
+
+    # record a reference of line to a symbol not yet defined
+    def refer(self, symbol, line, ref, reftype):
+        self.stats.forward_refs += 1
+        fixup = Fixup(line, ref, reftype)
+        pending = self.fixups.get(symbol)
+        if pending is None:
+            self.fixups[symbol] = [fixup]
+        else:
+            pending.append(fixup)
 
     # get current line
     def current_line(self):
-        return self.content[self.lineno - 1]
+        return self.current
 
-    # output object file
-    def output(self, file_name):
-        with open(file_name, "w") as f:
-            f.write("H%-6s%06X%06X" % (self.name, self.start_addr, self.LOCCTR - self.start_addr))
-            M_list = []
-            newrecord = True
-            colcount = 0
-            i = 0
-            line = self.content[0]
-            last = line
-            brk = False
-            litpool = False
-            while i < len(self.content):
-                line = self.content[i]
-                if newrecord:
-                    if line.loc == None:
-                        i += 1
-                        continue
-                    rec = "\nT%06XLL" % line.loc
-                    newrecord = False
-                    colcount = 0
-
-                # INSTRUCTIONS OR BYTE/WORD
-                if line.code != "":
-                    codefmt = "%%0%dX" % (line.fmt * 2)
-                    code = codefmt % line.code
-                # other directives or empty line
-                else:
-                    if any(line.litpool):
-                        lit = line.litpool.pop(0)
-                        code = lit[2]
-                        codefmt = "%%0%dX" % (len(lit[1]) - 3)
-                        code = codefmt % code
-                        line.litpool = line.litpool[:1]
-                        litpool = True
-                    else:
-                        i += 1
-                        continue
-
-                # check if have to break the record
-                # too far to last instruction
-                if line.code != "" and line.loc != None and last.code != "" and (line.loc > last.loc + last.fmt * 2) and not brk:
-                    newrecord = True
-                    brk = True
-                # exceed record length
-                elif colcount + len(code) > 60:
-                    newrecord = True
-
-                # need to relocate
-                if line.fmt == 4 and line.code & ((DEFAULT_ADDR ^ IMM_ADDR) << BYTESIZE):
-                    M_list.append(line)
-
-                if newrecord:
-                    rec = rec.replace("LL", "%02X" % (colcount // 2))
-                    f.write(rec)
-                    continue
-                else:
-                    colcount += len(code)
-                    rec += code
-                    last = line
-                    i += 1
-                    if brk:
-                        brk = False
-            for lit in self.endlitpool:
-                code = lit[2]
-                codefmt = "%%0%dX" % (len(lit[1]) - 3)
-                code = codefmt % code
-                line.litpool = line.litpool[:1]
-                litpool = True
-                colcount += len(code)
-                rec += code
-            rec = rec.replace("LL", "%02X" % (colcount // 2))
-            f.write(rec)
-            for line in M_list:
-                f.write("\nM%06X%02X" % (line.loc + 1, 5))
-            f.write("\nE%06X" % self.start_exec)
+    # output object file, in the text or binary format
+    def output(self, file_name, fmt="text"):
+        start = time.perf_counter()
+        write_object(file_name, self.records(), fmt)
+        self.stats.times["output"] += time.perf_counter() - start
+
+    # generate the object code of each statement and literal as (address, hex) pairs
+    def object_codes(self):
+        for line in self.content:
+            if line.code != "":
+                yield (line.loc, "%0*X" % (line.fmt * 2, line.code))
+            for lit in line.litpool:
+                yield (lit[0], "%0*X" % (lit[3] * 2, lit[2]))
+        for lit in self.endlitpool:
+            yield (lit[0], "%0*X" % (lit[3] * 2, lit[2]))
+
+    # generate the records of the object file, a text record is broken when the
+    # next object code is not contiguous or it exceeds 30 bytes
+    def records(self):
+        yield "H%-6s%06X%06X" % (self.name, self.start_addr, max(self.highest, self.LOCCTR) - self.start_addr)
+        for i in range(0, len(self.extdefs), 5):
+            yield "D" + "".join(["%-6s%06X" % (name, self.symtab[name]) for name, line in self.extdefs[i:i + 5]])
+        externals = list(self.externals)
+        for i in range(0, len(externals), 12):
+            yield "R" + "".join(["%-6s" % name for name in externals[i:i + 12]])
+        start = None
+        nextloc = None
+        codes = []
+        size = 0
+        for loc, code in self.object_codes():
+            if loc != nextloc or size + len(code) > 60:
+                if codes:
+                    self.stats.t_records += 1
+                    yield "T%06X%02X%s" % (start, size // 2, "".join(codes))
+                start = loc
+                codes = []
+                size = 0
+            codes.append(code)
+            size += len(code)
+            nextloc = loc + len(code) // 2
+        if codes:
+            self.stats.t_records += 1
+            yield "T%06X%02X%s" % (start, size // 2, "".join(codes))
+        # format 4 instructions with direct addresses need to relocate
+        relocations = self.relocations
+        for line in self.content:
+            if line.extended and line.code != "" and line.code & ((DEFAULT_ADDR ^ IMM_ADDR) << BYTESIZE) and line.loc + 1 not in relocations:
+                self.stats.m_records += 1
+                yield "M%06X05" % (line.loc + 1)
+        # words holding a relative expression and external references
+        for addr in sorted(relocations):
+            for modification in relocations[addr]:
+                self.stats.m_records += 1
+                yield "M%06X%s" % (addr, modification)
+        # only the first control section has the entry point
+        if self.primary:
+            yield "E%06X" % self.start_exec
+        else:
+            yield "E"
 
 def handler_START(program, tokens):
     if "START" in tokens:
@@ -205,8 +695,10 @@ def handler_START(program, tokens):
             program.error("Multiple START detected.")
         elif tokens[0] == "START":
             program.error("Must specify a name for program before START.")
-        elif tokens[2] == "START":
+        elif tokens[1] != "START":
             program.error("Multiple tokens were specified before START.")
+        elif len(tokens) < 3:
+            program.error("Requires a starting address for START.")
         if "CHECK PROGRAM NAME FORMAT" != 0:
             pass
 
@@ -216,7 +708,9 @@ def handler_START(program, tokens):
         try:
             program.start_addr = int(tokens[2], 16)
         except ValueError:
-            program.error("%s is an invalid value for starting address (hexadecimal is required)." % tokens[2])
+            program.error("%s is an invalid value for starting address (hexadecimal is required)." % tokens[2], token=tokens[2])
+        # the statements are located from the starting address
+        program.LOCCTR = program.start_addr
         program.started = True
         program.current_line().loc = None
 
@@ -226,87 +720,100 @@ def handler_END(program, tokens):
 def handler_BYTE(program, tokens):
     if tokens[0] == "BYTE":
         program.error("Must specify a label for the allocated space.")
-    elif tokens[2] == "BYTE":
+    elif tokens[1] != "BYTE":
         program.error("Multiple label were specified for BYTE.")
     elif len(tokens) < 3:
         program.error("Requires an value for BYTE.")
 
     "CHECK LABEL NAME"
     value = tokens[2]
-    if value[0] == 'C':
-        "CHECK MATCHING QUOTION MARKS"
-        hexstr = ''.join(["%2X" % c for c in value[2:-1].encode()])
-        program.current_line().code = int(hexstr, 16)
-        program.current_line().fmt = len(value[2:-1])
-        if tokens[0] in program.symtab and type(program.symtab[tokens[0]]) == list:
-            fill_forward(program.symtab[tokens[0]], program.LOCCTR, program)
-        program.symtab[tokens[0]] = program.LOCCTR
-        program.LOCCTR += len(value[2:-1])
-    elif value[0] == 'X':
-        try:
-            "CHECK QUOTION MARKS"
-            program.current_line().code = int(value[2:-1], 16)
-            program.current_line().fmt = 1
-            if tokens[0] in program.symtab and type(program.symtab[tokens[0]]) == list:
-                fill_forward(program.symtab[tokens[0]], program.LOCCTR, program)
-            program.symtab[tokens[0]] = program.LOCCTR
-            program.LOCCTR += 1
-        except ValueError:
-            program.error("The \"X\" requires a hex value, but %s is not." % value[2:-1])
+    code, size = encode_constant(program, value)
+    program.current_line().code = code
+    program.current_line().fmt = size
+    program.define(tokens[0], program.LOCCTR)
+    program.LOCCTR += size
 
 def handler_WORD(program, tokens):
     if tokens[0] == "WORD":
         program.error("Must specify a label for the allocated space.")
-    elif tokens[2] == "WORD":
+    elif tokens[1] != "WORD":
         program.error("Multiple label were specified for WORD.")
     elif len(tokens) < 3:
         program.error("Requires an value for WORD.")
 
+    line = program.current_line()
+    line.fmt = 3
+    program.define(tokens[0], program.LOCCTR)
+    # a hex value, otherwise an expression
     try:
-        value = int(tokens[2], 16)
-        if not -(2**11) < value < 2**11 - 1:
-            program.current_line().code = value
-            program.current_line().fmt = 3
-        else:
-            program.error("Value exceed the range of a byte.")
-        if tokens[0] in program.symtab and type(program.symtab[tokens[0]]) == list:
-            fill_forward(program.symtab[tokens[0]], program.LOCCTR, program)
-        program.symtab[tokens[0]] = program.LOCCTR
-        program.LOCCTR += 3
+        value = (NUM, int(tokens[2], 16), 0, ())
     except ValueError:
-        program.error("Invalid hex value %s." % tokens[2])
+        value, missing = program.evaluate(tokens[2], program.LOCCTR)
+        if missing is not None:
+            line.code = 0
+            program.refer(missing, line, value, REF_WORD)
+            value = None
+    if value is not None:
+        fill_word(line, value, program)
+    program.LOCCTR += 3
+
+# fill the word of line with the value of an expression, a relative value is
+# relocated by an M record, and so is each external reference
+def fill_word(line, value, program):
+    if not -(2**23) <= value[1] < 2**24:
+        program.error("Value exceed the range of a word.", line, "range")
+    elif value[2] not in (0, 1):
+        program.error("Invalid relative expression.", line, "expression")
+    line.code = value[1] & 0xFFFFFF
+    modifications = ["06" + ref for ref in value[3]]
+    if value[2]:
+        modifications.insert(0, "06")
+    if modifications:
+        program.relocations[line.loc] = modifications
+    else:
+        program.relocations.pop(line.loc, None)
 
 def handler_RESW(program, tokens):
     if tokens[0] == "RESW":
         program.error("Must specify a label for the allocated space.")
-    elif tokens[2] == "RESW":
+    elif tokens[1] != "RESW":
         program.error("Multiple label were specified for RESW.")
     elif len(tokens) < 3:
         program.error("Requires an length for RESW.")
 
     "CHECK LABEL NAME"
-    "LENGTH IS DECIMAL"
-    if tokens[0] in program.symtab and type(program.symtab[tokens[0]]) == list:
-        fill_forward(program.symtab[tokens[0]], program.LOCCTR, program)
-    program.symtab[tokens[0]] = program.LOCCTR
-    program.LOCCTR += int(tokens[2]) * 3
+    program.define(tokens[0], program.LOCCTR)
+    program.LOCCTR += absolute_value(program, tokens[2]) * 3
 
 def handler_RESB(program, tokens):
     if tokens[0] == "RESB":
         program.error("Must specify a label for the allocated space.")
-    elif tokens[2] == "RESB":
+    elif tokens[1] != "RESB":
         program.error("Multiple label were specified for RESB.")
     elif len(tokens) < 3:
         program.error("Requires an length for RESB.")
 
     "CHECK LABEL NAME"
-    "LENGTH IS DECIMAL"
-    if tokens[0] in program.symtab and type(program.symtab[tokens[0]]) == list:
-        fill_forward(program.symtab[tokens[0]], program.LOCCTR, program)
-    program.symtab[tokens[0]] = program.LOCCTR
-    program.LOCCTR += int(tokens[2])
+    program.define(tokens[0], program.LOCCTR)
+    program.LOCCTR += absolute_value(program, tokens[2])
+
+# the count of RESB or RESW, an expression which must be absolute, defined
+# before and not negative
+def absolute_value(program, text):
+    if text.isdigit():
+        return int(text)
+    value, missing = program.evaluate(text, program.LOCCTR)
+    if missing is not None:
+        program.error("Symbol %s must be defined before." % missing, code="undefined", token=missing)
+    elif value[2] or value[3]:
+        program.error("%s is not an absolute expression." % text, code="expression", token=text)
+    elif value[1] < 0:
+        program.error("operand with value = %d is out of range." % value[1], code="range", token=text)
+    return value[1]
 
 def handler_BASE(program, tokens):
+    if tokens[0] != "BASE" or len(tokens) != 2:
+        program.error("BASE requires a symbol and no label.")
     program.base = tokens[1]
     program.current_line().loc = None
 
@@ -315,48 +822,108 @@ def handler_NOBASE(program, tokens):
     program.current_line().loc = None
 
 def handler_LTORG(program, tokens):
-    for key, lit_lst in program.littab.items():
-        if key[0] == 'C':
-            hexstr = ''.join(["%2X" % c for c in key[2:-1].encode()])
-            code = int(hexstr, 16)
-            
-            fill_lit(lit_lst, program.LOCCTR, program)
-            program.littab[key] = program.LOCCTR
-            program.current_line().litpool.append((program.LOCCTR, key, code))
-            program.LOCCTR += len(key[2:-1])
-        elif key[0] == 'X':
-            try:
-                code = int(key[2:-1], 16)
-                fill_lit(lit_lst, program.LOCCTR, program)
-                program.littab[key] = program.LOCCTR
-                program.current_line().litpool.append((program.LOCCTR, key, code))
-                program.LOCCTR += 1
-            except ValueError:
-                program.error("The \"X\" requires a hex value, but %s is not." % value[2:-1])
+    program.current_line().litpool = place_literals(program)
 
 def end_LITPOOL(program):
-    for key, lit_lst in program.littab.items():
-        if type(lit_lst) != list:
-            continue
-        if key[0] == 'C':
-            hexstr = ''.join(["%2X" % c for c in key[2:-1].encode()])
-            
-            fill_lit(lit_lst, program.LOCCTR, program)
-            program.littab[key] = program.LOCCTR
-            program.endlitpool.append((program.LOCCTR, key, hexstr))
-            program.LOCCTR += len(key[2:-1])
-        elif key[0] == 'X':
-            try:
-                code = int(key[2:-1], 16)
-                fill_lit(lit_lst, program.LOCCTR, program)
-                program.littab[key] = program.LOCCTR
-                program.endlitpool.append((program.LOCCTR, key, code))
-                program.LOCCTR += 1
-            except ValueError:
-                program.error("The \"X\" requires a hex value, but %s is not." % value[2:-1])
+    program.endlitpool = place_literals(program)
+
+# place the literals referred since the last pool at LOCCTR, the table only
+# holds the pending literals so a pool never rescans the earlier ones, the
+# address of each placed literal is kept for the references after the pool
+def place_literals(program):
+    pool = []
+    for key, (code, size, lit_lst) in program.littab.items():
+        fill_lit(lit_lst, program.LOCCTR, program)
+        pool.append((program.LOCCTR, key, code, size))
+        program.literals[key] = program.LOCCTR
+        program.LOCCTR += size
+    program.littab = {}
+    program.stats.literals += len(pool)
+    return pool
 
 def handler_EQU(program, tokens):
-    print("EQU")
+    if tokens[0] == "EQU":
+        program.error("Must specify a symbol for EQU.")
+    elif len(tokens) < 3:
+        program.error("Requires an expression for EQU.")
+    elif tokens[1] != "EQU":
+        program.error("Multiple label were specified for EQU.")
+
+    line = program.current_line()
+    line.loc = None
+    value, missing = program.evaluate(tokens[2], program.LOCCTR)
+    if missing is None:
+        define_equ(program, line, tokens[0], value)
+    else:
+        program.refer(missing, line, (tokens[0], value), REF_EQU)
+
+# define symbol as the value of the EQU statement of line, which is listed as
+# its location
+def define_equ(program, line, symbol, value):
+    if value[2] not in (0, 1):
+        program.error("Invalid relative expression.", line, "expression")
+    elif value[3]:
+        program.error("EQU does not accept external references.", line, "external")
+    elif symbol in program.symtab:
+        program.error("redefined symbol \"%s\"." % symbol, line, "redefined", symbol)
+    if not value[2]:
+        program.absolute.add(symbol)
+    line.loc = value[1]
+    program.define(symbol, value[1])
+
+# ORG sets the location counter to an expression, ORG without an operand
+# restores the location counter before the first ORG
+def handler_ORG(program, tokens):
+    if tokens[0] != "ORG":
+        program.error("ORG does not accept a label.")
+    program.current_line().loc = None
+    program.highest = max(program.highest, program.LOCCTR)
+    if len(tokens) == 1:
+        if program.org_return is None:
+            program.error("No previous ORG to return from.")
+        program.LOCCTR = program.org_return
+        program.org_return = None
+        return
+    value, missing = program.evaluate(tokens[1], program.LOCCTR)
+    if missing is not None:
+        program.error("Symbol %s must be defined before." % missing, code="undefined", token=missing)
+    elif value[2] not in (0, 1) or value[3]:
+        program.error("Invalid relative expression.", code="expression", token=tokens[1])
+    elif value[1] < 0:
+        program.error("operand with value = %d is out of range." % value[1], code="range", token=tokens[1])
+    if program.org_return is None:
+        program.org_return = program.LOCCTR
+    program.LOCCTR = value[1]
+
+# CSECT begins a control section, the source is split at each CSECT before
+# assembling so a Program only sees it as its first statement
+def handler_CSECT(program, tokens):
+    if tokens[0] == "CSECT":
+        program.error("Must specify a name for the control section.")
+    elif program.started:
+        program.error("CSECT must begin a control section.")
+    program.name = tokens[0]
+    if len(program.name) > 6:
+        program.error("Section name must not longer than 6 characters.")
+    program.started = True
+    program.primary = False
+    program.current_line().loc = None
+
+def handler_EXTDEF(program, tokens):
+    if tokens[0] != "EXTDEF" or len(tokens) != 2:
+        program.error("EXTDEF requires a list of symbols and no label.")
+    for name in tokens[1].split(','):
+        program.extdefs.append((name, program.current_line()))
+    program.current_line().loc = None
+
+def handler_EXTREF(program, tokens):
+    if tokens[0] != "EXTREF" or len(tokens) != 2:
+        program.error("EXTREF requires a list of symbols and no label.")
+    for name in tokens[1].split(','):
+        if name in program.symtab or name in program.fixups:
+            program.error("External symbol %s must be declared before it is used or defined." % name, code="external", token=name)
+        program.externals[name] = program.current_line()
+    program.current_line().loc = None
 
 DIRTAB = {
     "START" : handler_START,
@@ -369,141 +936,232 @@ DIRTAB = {
     "NOBASE" : handler_NOBASE,
     "LTORG" : handler_LTORG,
     "EQU" : handler_EQU,
+    "ORG" : handler_ORG,
+    "CSECT" : handler_CSECT,
+    "EXTDEF" : handler_EXTDEF,
+    "EXTREF" : handler_EXTREF,
 }
 
+# directives which define their label
+LABELLED_DIRECTIVES = frozenset(["BYTE", "WORD", "RESB", "RESW", "EQU"])
+
+# characters which make an operand an expression rather than a symbol
+EXPRESSION_CHARS = frozenset("+-*/()")
+
+# format 2 instructions which accept 2 operands
+REGISTER_PAIR = frozenset(["ADDR", "COMPR", "DIVR", "MULR", "RMO", "SHIFTL", "SHIFTR", "SUBR"])
+SHIFTS = frozenset(["SHIFTL", "SHIFTR"])
+
+# every reserved mnemonic (with its format 4 form), used by the lexer to tell
+# labels from mnemonics, maps to the (mnemonic, format prefix) pair
+KEYWORDS = {}
+for key in list(OPTAB) + list(DIRTAB):
+    KEYWORDS[sys.intern(key)] = (key, "")
+for key, inst in OPTAB.items():
+    if inst.inf & FORMAT4:
+        KEYWORDS[sys.intern('+' + key)] = (key, '+')
+
+# fill a format 3 displacement with base-relative addressing if possible
+def fill_base(line, addr, program):
+    base = program.symtab.get(line.base)
+    # forward base reference
+    if base is None:
+        program.refer(line.base, line, addr, REF_BASE)
+        return
+    disp = addr - base
+    if 0 <= disp < 4096:
+        line.code |= (disp & 0xFFF) | BASE_RELATIVE
+    else:
+        program.overflow(line, line.fmt, "no enough length to hold the displacement, try format 4.")
+
+# fill the instruction of line which referencing address addr
+def fill_address(line, addr, program):
+    if line.fmt == 3:
+        disp = (addr - (line.loc + line.fmt))
+        if -2048 <= disp < 2048:
+            line.code |= (disp & 0xFFF) | PC_RELATIVE
+        elif line.base != -1:
+            fill_base(line, addr, program)
+        else:
+            program.overflow(line, line.fmt, "no enough length to hold the displacement, try format 4.")
+    elif line.fmt == 4:
+        line.code |= addr
+
 # fill the instructions which referencing foward symbols
 def fill_forward(fwd_lst, addr, program):
-    for line, ref, reftype in fwd_lst:
-        if reftype == REF_OP:
-            if line.fmt == 3:
-                disp = (addr - (line.loc + line.fmt))
-                if -2048 <= disp < 2048:
-                    line.code |= (disp & 0xFFF) | PC_RELATIVE
-                elif line.base != -1:
-                    # if base is defined
-                    if line.base in program.symtab and type(program.symtab[line.base]) != list:
-                        disp = (addr - program.symtab[line.base])
-                        if 0 <= disp < 4096:
-                            code |= (disp & 0xFFF) | BASE_RELATIVE
-                        else:
-                            program.error("no enough length to hold the displacement, try format 4.", line)
-                    # forward base reference
-                    elif line.base in program.symtab:
-                        program.symtab[line.base].append((program.current_line(), REF_BASE))
-                    else:
-                        program.symtab[line.base] = [(program.current_line(), REF_BASE)]
+    program.stats.fill_forward += 1
+    for fixup in fwd_lst:
+        try:
+            if fixup.reftype == REF_OP:
+                if fixup.line.fmt == 2:
+                    fixup.line.code |= register_value(program, fixup.line, fixup.ref, addr) << 4
+                elif fixup.ref in program.absolute:
+                    fill_value(fixup.line, (NUM, addr, 0, ()), program)
                 else:
-                    program.error("no enough length to hold the displacement, try format 4.", line)
-            elif line.fmt == 4:
-                line.code |= addr
-        elif reftype == REF_BASE:
-            disp = program.symtab[ref] - addr
-            if 0 <= disp < 4096:
-                line.code |= (disp & 0xFFF) | BASE_RELATIVE
+                    fill_address(fixup.line, addr, program)
+            # the second register of a format 2 instruction, ref is the
+            # symbol and whether it is a shift count
+            elif fixup.reftype == REF_REG:
+                fixup.line.code |= register_value(program, fixup.line, fixup.ref[0], addr, fixup.ref[1])
+            # the base register is now defined, ref is the target address
+            elif fixup.reftype == REF_BASE:
+                disp = fixup.ref - addr
+                if 0 <= disp < 4096:
+                    fixup.line.code |= (disp & 0xFFF) | BASE_RELATIVE
+                else:
+                    program.overflow(fixup.line, fixup.line.fmt, "no enough length to hold the displacement, try format 4.")
             else:
-                program.error("no enough length to hold the displacement, try format 4.", line)
+                resolve(fixup, program)
+        # the other references are still filled when all the errors are collected
+        except AssembleError:
+            if not program.all_errors:
+                raise
+
+# fill the instruction of line with the value of an expression, an absolute
+# value is used as the address or immediate value directly, and external
+# references are left to the loader
+def fill_value(line, value, program):
+    if line.fmt == 2 and (value[2] != 0 or value[3]):
+        program.error("A register operand must be absolute.", line, "expression")
+    elif value[3]:
+        fill_external(line, value, program)
+    elif value[2] == 1:
+        fill_address(line, value[1], program)
+    elif value[2] != 0:
+        program.error("Invalid relative expression.", line, "expression")
+    elif value[1] < 0 or (line.fmt == 2 and value[1] > 15):
+        program.error("operand with value = %d is out of range." % value[1], line, "range")
+    # the first register of format 2 takes the high nibble
+    elif line.fmt == 2:
+        line.code |= value[1] << 4
+    elif (line.fmt == 3 and value[1] > 2**12 - 1) or (line.fmt == 4 and value[1] > 2**20 - 1):
+        program.overflow(line, line.fmt, "operand with value = %d is out of range." % value[1])
+    else:
+        line.code |= value[1]
+
+# the second operand of a format 2 instruction, a register or the count of a
+# shift which is encoded minus one
+def second_register(program, inst, operand2):
+    if operand2.isnumeric():
+        count = int(operand2) - 1 if inst in SHIFTS else int(operand2)
+        if not 0 <= count <= 15:
+            program.error("operand with value = %s is out of range." % operand2, code="range", token=operand2)
+        return count
+    if operand2 not in program.symtab:
+        program.refer(operand2, program.current_line(), (operand2, inst in SHIFTS), REF_REG)
+        return 0
+    return register_value(program, program.current_line(), operand2, program.symtab[operand2], inst in SHIFTS)
+
+# the value of the register or shift count symbol of a format 2 instruction
+# defined as value, an address is not a register
+def register_value(program, line, symbol, value, shift=False):
+    if symbol not in program.absolute:
+        program.error("%s is an address, not a register." % symbol, line, "expression", symbol)
+    count = value - 1 if shift else value
+    if not 0 <= count <= 15:
+        program.error("operand with value = %d is out of range." % value, line, "range", symbol)
+    return count
+
+def fill_external(line, value, program):
+    if line.fmt != 4:
+        program.error("External reference %s requires format 4." % value[3][0][1:], line, "external", value[3][0][1:])
+    elif value[2] not in (0, 1):
+        program.error("Invalid relative expression.", line, "expression")
+    line.code |= value[1] & 0xFFFFF
+    modifications = ["05" + ref for ref in value[3]]
+    if value[2]:
+        modifications.insert(0, "05")
+    program.relocations[line.loc + 1] = modifications
+
+# evaluate a deferred expression again once a symbol it refers to is defined,
+# it waits for the next symbol if there is still one not yet defined
+def resolve(fixup, program):
+    line = fixup.line
+    tree = fixup.ref[1] if fixup.reftype == REF_EQU else fixup.ref
+    try:
+        tree = fold(tree, program.symtab, program.absolute, externals=program.externals)
+    except ExpressionError as e:
+        program.error(str(e), line, "expression")
+    missing = undefined_symbol(tree)
+    if missing is not None:
+        program.refer(missing, line, (fixup.ref[0], tree) if fixup.reftype == REF_EQU else tree, fixup.reftype)
+    elif fixup.reftype == REF_EXPR:
+        fill_value(line, tree, program)
+    elif fixup.reftype == REF_WORD:
+        fill_word(line, tree, program)
+    else:
+        define_equ(program, line, fixup.ref[0], tree)
 
 def fill_lit(lit_lst, addr, program):
+    program.stats.fill_lit += 1
     for line in lit_lst:
-        if line.fmt == 3:
-            disp = (addr - (line.loc + line.fmt))
-            if -2048 <= disp < 2048:
-                line.code |= (disp & 0xFFF) | PC_RELATIVE
-            elif line.base != -1:
-                # if base is defined
-                if line.base in program.symtab and type(program.symtab[line.base]) != list:
-                    disp = (addr - program.symtab[line.base])
-                    if 0 <= disp < 4096:
-                        code |= (disp & 0xFFF) | BASE_RELATIVE
-                    else:
-                        program.error("no enough length to hold the displacement, try format 4.", line)
-                # forward base reference
-                elif line.base in program.symtab:
-                    program.symtab[line.base].append((program.current_line(), REF_BASE))
-                else:
-                    program.symtab[line.base] = [(program.current_line(), REF_BASE)]
-            else:
-                program.error("no enough length to hold the displacement, try format 4.", line)
-        elif line.fmt == 4:
-            line.code |= addr
-
-def has_directives(program, tokens):
-    for token in tokens:
-        if token in DIRTAB:
-            DIRTAB[token](program, tokens)
-            return True
-    return False
+        try:
+            fill_address(line, addr, program)
+        except AssembleError:
+            if not program.all_errors:
+                raise
 
-def has_instructions(program, tokens):
-    if len(tokens) == 0:
+def has_directives(program, stmt):
+    handler = DIRTAB.get(stmt[2])
+    if handler is None:
         return False
+    handler(program, stmt[0])
+    return True
 
-    inst = ""
-    operand = ""
-    operand2 = ""
-    fmt = 0
-    for idx, token in enumerate(tokens):
-        # instruction hasn't meet yet (instruction or label)
-        if inst == "":
-            # instruction without prefix
-            if token in OPTAB:
-                inst = token
-            # instruction with prefix
-            elif token[1:] in OPTAB:
-                prefix = token[0]
-                inst = token[1:]
-                if prefix != '+':
-                    program.error("invalid instruction prefix \"%s\"." % prefix)
-                elif not (OPTAB[inst].inf & FORMAT4):
-                    program.error("%s does not support format 4." % inst)
-                else:
-                    fmt = 4
-            # is label
-            else:
-                label = tokens[0]
-                # check label format
-                if label in OPTAB:
-                    program.error("symbol name \"%s\" is same as an insturction." % label)
-                elif label in program.symtab and type(program.symtab[label]) != list:
-                    program.error("redefined symbol \"%s\"." % label)
-                elif label in program.symtab:
-                    fill_forward(program.symtab[label], program.LOCCTR, program)
-                program.symtab[label] = program.LOCCTR
-                continue
-        # instruction met (operand)
+def has_instructions(program, stmt):
+    tokens, label, inst, extended, prefix, operands = stmt
+    info = OPTAB.get(inst)
+    if info is None:
+        return False
+
+    fmt = info.fmt
+    if extended != "":
+        if extended != '+':
+            program.error("invalid instruction prefix \"%s\"." % extended)
+        elif not (info.inf & FORMAT4):
+            program.error("%s does not support format 4." % inst)
         else:
-            if token.find(',') != -1:
-                operand, operand2, *dummy = token.split(',')
-                if any(dummy):
-                    program.error("too many operands")
-            else:
-                operand = token
+            fmt = 4
+    elif program.promoted and program.index in program.promoted:
+        fmt = 4
+
+    if label is not None:
+        # check label format
+        if label in OPTAB:
+            program.error("symbol name \"%s\" is same as an insturction." % label)
+        elif label in program.symtab or label in program.externals:
+            program.error("redefined symbol \"%s\"." % label, code="redefined", token=label)
+        program.define(label, program.LOCCTR)
 
-    # compute the instruction format
-    if fmt != 4:
-        mask = OPTAB[inst].inf & (FORMAT1 | FORMAT2 | FORMAT3)
-        while mask != 0b1000:
-            mask >>= 1
-            fmt += 1
-        fmt = (5 - fmt)
+    operand = ""
+    operand2 = ""
+    if len(operands) > 2:
+        program.error("too many operands")
+    elif len(operands) == 2:
+        operand, operand2 = operands
+    elif operands:
+        operand = operands[0]
 
     # validate the foramt
+    if "" in operands:
+        program.error("Empty operand.", token=tokens[-1])
+    if fmt != 1 and inst != "RSUB" and not operands:
+        program.error("%s requires an operand." % inst, token=inst)
+    if fmt == 2 and inst in REGISTER_PAIR and len(operands) != 2:
+        program.error("%s requires two operands." % inst, token=inst)
+    elif fmt == 2 and inst not in REGISTER_PAIR and len(operands) != 1:
+        program.error("%s takes one operand." % inst, token=inst)
     if (operand2 != "" and fmt != 2) and operand2 != 'X':
         program.error("Only format 2 insturctions allow two operands.")
     if fmt == 1 and operand != "":
         program.error("Format 1 instructions should not have any operands.")
 
     # generate opcode
-    code = OPTAB[inst].opcode
+    code = info.opcode
     isLiteral = False
+    placed = None
     # parse the prefix for format 3 & 4 instructions
     if (fmt == 3 or fmt == 4) and inst != "RSUB":
-        prefix = ""
-        # parse the operand
-        if not operand[0].isalnum():
-            prefix = operand[0]
-            operand = operand[1:]
-
         # generate the addressing mask (nixbpe)
         mask = DEFAULT_ADDR
         if prefix == '#':
@@ -512,16 +1170,18 @@ def has_instructions(program, tokens):
             mask = INDR_ADDR
         elif prefix == '=':
             isLiteral = True
-            if operand not in program.littab:
-                program.littab[operand] = [program.current_line()]
-            # already defined or is not yet
-            elif operand in program.littab:
-                # try to use but if is too far, wait next
-                pass
-            else:
-                program.littab[operand].append(program.current_line())
+            # reuse a literal of an earlier pool when it is in reach,
+            # otherwise the same literal is placed once in the next pool
+            placed = program.literals.get(operand)
+            if placed is not None and fmt == 3 and not -2048 <= placed - (program.LOCCTR + fmt) < 2048:
+                placed = None
+            if placed is None:
+                pending = program.littab.get(operand)
+                if pending is None:
+                    pending = program.littab[operand] = encode_constant(program, operand) + ([],)
+                pending[2].append(program.current_line())
         elif prefix != "":
-            program.error("Unrecognized addressing prefix \"%s\"." % prefix)
+            program.error("Unrecognized addressing prefix \"%s\"." % prefix, token=prefix + operand)
 
         if operand2 == 'X':
             mask |= INDEX_ADDR
@@ -532,82 +1192,428 @@ def has_instructions(program, tokens):
     # handle format 3/4 instruction which has no operand
     elif inst == "RSUB":
         code |= DEFAULT_ADDR
+    elif prefix != "":
+        program.error("Format %d instructions do not accept addressing prefix." % fmt)
     
     # shift format 4 instructions
     if fmt == 4:
         code <<= BYTESIZE
     
     # generate operand
-    if inst != "RSUB" and not isLiteral:
+    # a literal of an earlier pool is a relative value
+    value = None if placed is None else (NUM, placed, 1, ())
+    if fmt != 1 and inst != "RSUB" and not isLiteral:
+        # some format 2 instruction accept 2 operands
+        if fmt == 2 and inst in REGISTER_PAIR:
+            code |= second_register(program, inst, operand2)
         if operand.isnumeric():
             operand = int(operand)
-            if (fmt == 3 and operand > 2**12 - 1) or (fmt == 4 and operand > 2**20 - 1):
-                program.error("operand with value = %d is out of range." % operand)
+            if fmt == 2:
+                value = (NUM, operand, 0, ())
+            elif (fmt == 3 and operand > 2**12 - 1) or (fmt == 4 and operand > 2**20 - 1):
+                program.overflow(program.current_line(), fmt, "operand with value = %d is out of range." % operand, str(operand))
             else:
                 code |= operand
-        elif operand in program.symtab and type(program.symtab[operand]) != list:
+        elif operand in program.symtab and (fmt == 2 or operand not in program.absolute):
+            addr = program.symtab[operand]
             if fmt == 2:
-                # some format 2 instruction accept 2 operands
-                if inst in ["ADDR", "COMPR", "DIVR", "MULR", "RMO", "SHIFTL", "SHIFTR", "SUBR"]:
-                    code |= program.symtab[operand2]
-                "VALIDATE FORMAT2"
-                code |= program.symtab[operand] << 4
+                code |= register_value(program, program.current_line(), operand, addr) << 4
             elif fmt == 3:
-                disp = (program.symtab[operand] - (program.LOCCTR + fmt))
+                disp = (addr - (program.LOCCTR + fmt))
                 # try to use PC-realtive
                 if -2048 <= disp < 2048:
                     code |= (disp & 0xFFF) | PC_RELATIVE
                 # try to use base-relative
                 elif program.base != -1:
-                    # if base is defined
-                    if program.base in program.symtab and type(program.symtab[program.base]) != list:
-                        disp = (program.symtab[operand] - program.symtab[program.base]) & 0xFFF
-                        if 0 <= disp < 4096:
-                            code |= (disp & 0xFFF) | BASE_RELATIVE
-                        else:
-                            program.error("no enough length to hold the displacement, try format 4.")
+                    base = program.symtab.get(program.base)
                     # forward base reference
-                    elif program.base in program.symtab:
-                        program.symtab[program.base].append((program.current_line(), operand, REF_BASE))
+                    if base is None:
+                        program.refer(program.base, program.current_line(), addr, REF_BASE)
+                    elif 0 <= addr - base < 4096:
+                        code |= ((addr - base) & 0xFFF) | BASE_RELATIVE
                     else:
-                        program.symtab[program.base] = [(program.current_line(), operand, REF_BASE)]
-
+                        program.overflow(program.current_line(), fmt, "no enough length to hold the displacement, try format 4.", operand)
                 else:
-                    program.error("no enough length to hold the displacement, try format 4.")
+                    program.overflow(program.current_line(), fmt, "no enough length to hold the displacement, try format 4.", operand)
             elif fmt == 4:
-                code |= program.symtab[operand]
-        elif operand in program.symtab:
-            program.symtab[operand].append((program.current_line(), operand, REF_OP))
+                code |= addr
+        elif fmt == 2 or EXPRESSION_CHARS.isdisjoint(operand):
+            if operand in program.symtab:
+                value = (NUM, program.symtab[operand], 0, ())
+            elif operand in program.externals and fmt != 2:
+                value = (NUM, 0, 0, ('+' + operand,))
+            else:
+                program.refer(operand, program.current_line(), operand, REF_OP)
         else:
-            program.symtab[operand] = [(program.current_line(), operand, REF_OP)]
+            value, missing = program.evaluate(operand, program.LOCCTR)
+            if missing is not None:
+                program.refer(missing, program.current_line(), value, REF_EXPR)
+                value = None
+
+    # the format 3 statements kept short by relaxation
+    if fmt == 3 and program.relax and operand != "":
+        program.short += 1
 
     # find the first executable location
     if program.start_exec == -1:
         program.start_exec = program.LOCCTR
     program.LOCCTR += fmt
     program.current_line().fmt = fmt
+    program.current_line().extended = fmt == 4
     program.current_line().code = code
+    if value is not None:
+        fill_value(program.current_line(), value, program)
     return True
 
-if __name__ == "__main__":
-    # Parse the arguments
-    parser = argparse.ArgumentParser(description="A Python SIC/XE Assembler")
-    parser.add_argument('-o', '--output', help='the output file.', default='a.out')
-    parser.add_argument('-L', '--listing', help='generate assembly listing.')
-    parser.add_argument('input', nargs=1, help='the source assembly file(s).')
-    args = parser.parse_args()
+# class to store the result of assemble_source
+class Result:
+    __slots__ = ('ok', 'records', 'listing', 'symbols', 'diagnostics', 'stats')
 
-    print("SIC/XE Assembler")
+    def __init__(self, ok, records, listing, symbols, diagnostics, stats=None):
+        self.ok = ok
+        self.records = records
+        self.listing = listing
+        self.symbols = symbols
+        self.diagnostics = diagnostics
+        self.stats = stats
+
+    # the object file as written by sicas.py
+    def object_bytes(self):
+        return "\n".join(self.records).encode()
+
+# assemble a program held in memory without touching the filesystem, source is
+# a str, bytes or an iterable of lines, and name is used in the diagnostics,
+# which hold every error of the source if all_errors is set, relax widens
+# the instructions which do not fit format 3 and optimize applies peephole
+def assemble_source(source, name="<source>", listing=True, macro_libs=(), all_errors=False, relax=False, optimize=False):
+    if isinstance(source, bytes):
+        source = source.decode()
+    if isinstance(source, str):
+        source = source.splitlines()
+    else:
+        source = list(source)
+    return merge_results(assemble_sections(name, split_sections(source), listing, macro_libs, all_errors=all_errors, relax=relax, optimize=optimize))
+
+# split the source lines at each CSECT outside macro definitions, return a
+# list of (first line number, lines, macro definitions of the sections before)
+def split_sections(lines):
+    sections = []
+    definitions = []
+    defining = None
+    section = (1, [], [])
+    for lineno, text in enumerate(lines, 1):
+        text = text.rstrip('\r\n')
+        if defining is not None:
+            if "MEND" in text and split_statement(text)[1] == "MEND":
+                definitions.append(defining)
+                defining = None
+            else:
+                defining[2].append(text)
+        elif "MACRO" in text or "CSECT" in text:
+            label, mnemonic, operand = split_statement(text)
+            if mnemonic == "MACRO":
+                defining = (label, operand, [])
+            elif mnemonic == "CSECT" and section[1]:
+                sections.append(section)
+                section = (lineno, [], list(definitions))
+        section[1].append(text)
+    sections.append(section)
+    return sections
+
+# assemble one control section, sections are assembled in worker processes
+# when jobs > 1
+def assemble_section(name, section, listing=True, macro_libs=(), stats=False, all_errors=False, relax=False, optimize=False):
+    first_lineno, lines, definitions = section
+    passes = []
 
-    # Open files in the list
-    program = Program(args.input[0])
+    def new_program(promoted=frozenset()):
+        program = Program(name, keep_source=listing, stats=Stats() if stats else None, lines=lines, echo=False, macro_libs=macro_libs, first_lineno=first_lineno, all_errors=all_errors, relax=relax, promoted=promoted, optimize=optimize)
+        passes[:] = [program]
+        for definition in definitions:
+            program.macros.define(*definition)
+        return program
     try:
-        print("\nStarting assemble %s ..." % program.source)
+        if relax:
+            program = assemble_relaxed(new_program)
+        else:
+            program = new_program()
+            program.assemble()
+        records = list(program.records())
+    except (AssembleError, MacroError):
+        return Result(False, [], [], {}, passes[0].diagnostics, passes[0].stats)
+    # any other failure is still a diagnostic of the statement being assembled
+    except Exception as e:
+        program = passes[0]
+        if program.current is not None:
+            try:
+                program.error("Internal error: %s" % (str(e) or type(e).__name__), code="internal")
+            except AssembleError:
+                pass
+        return Result(False, [], [], {}, program.diagnostics, program.stats)
+    symbols = {symbol: addr for symbol, addr in program.symtab.items() if symbol not in PRELOAD_SYMTAB}
+    return Result(True, records, program.listing_rows() if listing else [], {program.name: symbols}, program.diagnostics, program.stats)
+
+def assemble_sections(name, sections, listing=True, macro_libs=(), stats=False, jobs=1, all_errors=False, relax=False, optimize=False):
+    if jobs > 1 and len(sections) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(assemble_section, name, section, listing, macro_libs, stats, all_errors, relax, optimize) for section in sections]
+            return [future.result() for future in futures]
+    return [assemble_section(name, section, listing, macro_libs, stats, all_errors, relax, optimize) for section in sections]
+
+# assemble the Program made by new_program(promoted) again until no format 3
+# statement overflows, each pass widens every statement which overflowed in the
+# one before, so the promoted statements only grow and a few passes suffice;
+# bytes saved counts the format 3 statements which would take 4 bytes if
+# every instruction were written in format 4
+def assemble_relaxed(new_program):
+    promoted = frozenset()
+    times = dict.fromkeys(Stats.PHASES, 0.0)
+    passes = 0
+    while True:
+        program = new_program(promoted)
         program.assemble()
-        print("Done.")
-        if args.listing:
-            program.listing(args.listing)
-        program.output(args.output)
-    except AssembleError:
+        passes += 1
+        if not program.overflows:
+            break
+        promoted = promoted | program.overflows
+        for phase in Stats.PHASES:
+            times[phase] += program.stats.times[phase]
+    stats = program.stats
+    for phase in Stats.PHASES:
+        stats.times[phase] += times[phase]
+    stats.relax_passes = passes
+    stats.relaxed = len(promoted)
+    stats.relax_saved = program.short
+    return program
+
+# merge the results of the control sections in source order, the symbols are
+# kept per section name
+def merge_results(results):
+    merged = Result(True, [], [], {}, [], Stats())
+    for result in results:
+        merged.ok = merged.ok and result.ok
+        merged.records.extend(result.records)
+        merged.listing.extend(result.listing)
+        merged.symbols.update(result.symbols)
+        merged.diagnostics.extend(result.diagnostics)
+        merged.stats.add(result.stats)
+    if len(results) == 1:
+        merged.symbols = next(iter(merged.symbols.values()), {})
+    return merged
+
+# assemble a single source file, return (source, succeeded, restored from cache)
+# the listing is written while assembling unless it needs the widest statement,
+# with diagnostics_format "json" the errors are reported as one JSON line
+def assemble_file(source, output, listing=None, listing_width=None, listing_format="text", cache_dir=None, cache_size=None, stats_format=None, macro_libs=(), jobs=1, all_errors=False, diagnostics_format="text", relax=False, optimize=False, object_format="text"):
+    stream = listing and (listing_width or listing_format != "text")
+    try:
+        if cache_dir:
+            cache = Cache(cache_dir, VERSION, cache_size or DEFAULT_MAX_SIZE)
+            libraries = [(path, library_signature(path)) for path in macro_libs]
+            key = cache.key(source, bool(listing), listing_width, listing_format, libraries, relax, optimize, object_format)
+            if cache.restore(key, output, listing):
+                print("\n%s restored from cache." % os.path.basename(source))
+                report_diagnostics([], source, diagnostics_format)
+                report_cached(source, stats_format)
+                return (source, True, True)
+        sections = read_sections(source, relax)
+        if sections is None:
+            program = Program(source, keep_source=bool(listing) and not stream, stats=Stats() if stats_format else None, echo=diagnostics_format == "text", macro_libs=macro_libs, all_errors=all_errors, optimize=optimize)
+    except OSError as e:
+        print("\n%s: %s" % (source, e.strerror))
+        return (source, False, False)
+    # an output which cannot be written fails this source only
+    try:
+        if sections is not None:
+            if not assemble_file_sections(source, sections, output, listing, listing_width, listing_format, stats_format, macro_libs, jobs, all_errors, diagnostics_format, relax, optimize, object_format):
+                return (source, False, False)
+        else:
+            try:
+                print("\nStarting assemble %s ..." % program.source)
+                if stream:
+                    with open(listing, "w") as f:
+                        program.assemble(Listing(f, listing_width, listing_format))
+                else:
+                    program.assemble()
+                print("Done.")
+                if optimize:
+                    report_peephole(program.stats)
+                if listing and not stream:
+                    program.listing(listing)
+                program.output(output, object_format)
+                report_diagnostics(program.diagnostics, source, diagnostics_format)
+                report_stats(program.stats, source, stats_format)
+            except AssembleError:
+                report_diagnostics(program.diagnostics, source, diagnostics_format)
+                print("Assemble failed.")
+                return (source, False, False)
+        if cache_dir:
+            cache.store(key, output, listing)
+    except OSError as e:
+        print("\n%s: %s" % (e.filename or source, e.strerror))
+        return (source, False, False)
+    return (source, True, False)
+
+# read the control sections of a source file, None if it has no CSECT and is
+# assembled while it is read, a relaxed source is always read in memory since
+# it is assembled again by each pass
+def read_sections(source, relax=False):
+    if not relax and not file_contains(source, "CSECT"):
+        return None
+    with open(source, "r") as f:
+        sections = split_sections(f)
+    if len(sections) == 1 and not relax:
+        return None
+    return sections
+
+# whether the file contains word, read in chunks of SCAN_SIZE characters so a
+# source without it is never held in memory
+def file_contains(source, word):
+    overlap = len(word) - 1
+    tail = ""
+    with open(source, "r") as f:
+        for chunk in iter(lambda: f.read(SCAN_SIZE), ""):
+            if word in chunk or word in tail + chunk[:overlap]:
+                return True
+            tail = (tail + chunk[-overlap:])[-overlap:]
+    return False
+
+# assemble the control sections of a source file and write the merged object
+# file and listing, return whether it succeeded
+def assemble_file_sections(source, sections, output, listing, listing_width, listing_format, stats_format, macro_libs, jobs, all_errors, diagnostics_format, relax, optimize, object_format):
+    name = os.path.basename(source)
+    if len(sections) > 1:
+        print("\nStarting assemble %s (%d control sections) ..." % (name, len(sections)))
+    else:
+        print("\nStarting assemble %s ..." % name)
+    result = merge_results(assemble_sections(name, sections, bool(listing), macro_libs, bool(stats_format), jobs, all_errors, relax, optimize))
+    if diagnostics_format == "text":
+        for diagnostic in result.diagnostics:
+            print(diagnostic)
+    report_diagnostics(result.diagnostics, source, diagnostics_format)
+    if not result.ok:
         print("Assemble failed.")
+        return False
+    print("Done.")
+    if relax:
+        stats = result.stats
+        print("Relaxed %d instructions to format 4 in %d pass%s, %d bytes saved." % (stats.relaxed, stats.relax_passes, "" if stats.relax_passes == 1 else "es", stats.relax_saved))
+    if optimize:
+        report_peephole(result.stats)
+    if listing:
+        width = listing_width or max([len(row[2]) for row in result.listing]) + 10
+        with open(listing, "w") as f:
+            Listing(f, width, listing_format).rows(result.listing)
+    write_object(output, result.records, object_format)
+    report_stats(result.stats, source, stats_format)
+    return True
+
+# write the records of an object file, converted to the binary format of
+# binobj if fmt is "binary"
+def write_object(file_name, records, fmt="text"):
+    if fmt == "binary":
+        with open(file_name, "wb") as f:
+            f.write(text_to_binary(records))
+    else:
+        with open(file_name, "w") as f:
+            f.write("\n".join(records))
+
+def report_peephole(stats):
+    print("Peephole rewrote %d statements, %d bytes saved." % (stats.peephole_rewrites, stats.peephole_saved))
+
+# the text diagnostics are printed as they are found, only their count is added
+def report_diagnostics(diagnostics, source, diagnostics_format):
+    if diagnostics_format == "json":
+        print(json.dumps({"source": source, "diagnostics": [diagnostic.as_dict() for diagnostic in diagnostics]}))
+    elif len(diagnostics) > 1:
+        print("%d errors in %s." % (len(diagnostics), os.path.basename(source)))
 
+def report_stats(stats, source, stats_format):
+    if stats_format == "json":
+        print(json.dumps(dict(stats.as_dict(), source=source)))
+    elif stats_format:
+        print("\nStatistics of %s:\n%s" % (os.path.basename(source), stats.report()))
+
+# a source restored from the cache is not assembled and has no statistics
+def report_cached(source, stats_format):
+    if stats_format == "json":
+        print(json.dumps({"source": source, "cached": True}))
+    elif stats_format:
+        print("\nStatistics of %s: restored from cache, not assembled." % os.path.basename(source))
+
+# assemble_file in a worker process, what it prints is returned with its
+# result so the messages of the inputs are printed in order, not interleaved
+def assemble_file_captured(*args, **kwargs):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        result = assemble_file(*args, **kwargs)
+    return (out.getvalue(), result)
+
+# derive the output filenames, with multiple inputs -o and -L name directories
+def output_names(args, source):
+    if len(args.input) == 1:
+        return (args.output or 'a.out', args.listing)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    output = os.path.join(args.output or '.', stem + '.obj')
+    listing = None
+    if args.listing:
+        listing = os.path.join(args.listing, stem + '.lst')
+    return (output, listing)
+
+# run the assembler with the command line arguments, return the exit status
+def main(argv=None, prog=None):
+    # Parse the arguments
+    parser = argparse.ArgumentParser(prog=prog, description="A Python SIC/XE Assembler")
+    parser.add_argument('-o', '--output', help='the output file (directory if multiple inputs, default: a.out).')
+    parser.add_argument('-L', '--listing', help='generate assembly listing (directory if multiple inputs).')
+    parser.add_argument('--listing-width', type=int, help='width of the source column of the listing.')
+    parser.add_argument('--listing-format', choices=Listing.FORMATS, default='text', help='format of the listing.')
+    parser.add_argument('--cache-dir', help='reuse the objects assembled from identical sources in this directory.')
+    parser.add_argument('--cache-size', type=int, help='size limit of the cache in MB (default: 64).')
+    parser.add_argument('--stats', action='store_true', help='report the time of each phase and counters.')
+    parser.add_argument('--stats-format', choices=('text', 'json'), default='text', help='format of the statistics reported.')
+    parser.add_argument('--macro-lib', dest='macro_libs', action='append', default=[], help='look up the macros not defined in the source in this library (may be repeated).')
+    parser.add_argument('--all-errors', action='store_true', help='go on after an error and report every error of the source.')
+    parser.add_argument('--diagnostics', dest='diagnostics_format', choices=('text', 'json'), default='text', help='format of the errors reported.')
+    parser.add_argument('--object-format', choices=('text', 'binary'), default='text', help='format of the object file (binary: see binobj.py).')
+    parser.add_argument('-O', '--optimize', action='store_true', help='rewrite the statements into shorter equivalents (peephole).')
+    parser.add_argument('--relax', action='store_true', help='assemble in format 4 the instructions whose displacement or value does not fit format 3.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of files, or control sections of a single file, to assemble in parallel.')
+    parser.add_argument('input', nargs='+', help='the source assembly file(s).')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("number of jobs must be at least 1.")
+
+    print("SIC/XE Assembler")
+
+    options = (args.listing_width, args.listing_format, args.cache_dir, args.cache_size and args.cache_size * 1024 * 1024, args.stats and args.stats_format, args.macro_libs)
+    modes = {"all_errors": args.all_errors, "diagnostics_format": args.diagnostics_format, "relax": args.relax, "optimize": args.optimize, "object_format": args.object_format}
+
+    # the control sections of a single input are assembled in parallel
+    if len(args.input) == 1 or args.jobs == 1:
+        results = [assemble_file(source, *output_names(args, source), *options, jobs=args.jobs, **modes) for source in args.input]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(assemble_file_captured, source, *output_names(args, source), *options, **modes) for source in args.input]
+            results = []
+            for future in futures:
+                output, result = future.result()
+                sys.stdout.write(output)
+                results.append(result)
+
+    # print the summary of each file
+    if len(results) > 1:
+        print("\nSummary:")
+        for source, ok, cached in results:
+            print("  %-8s%s%s" % ("OK" if ok else "FAILED", source, " (cached)" if cached else ""))
+        failed = sum(1 for source, ok, cached in results if not ok)
+        print("%d assembled, %d failed." % (len(results) - failed, failed))
+    if args.cache_dir:
+        hits = sum(1 for source, ok, cached in results if cached)
+        print("Cache: %d hits, %d misses." % (hits, len(results) - hits))
+    if not all(ok for source, ok, cached in results):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+#!/usr/bin/python
+
+# a drop-in replacement of sicas.py which sends the command line to sicasd.py,
+# the assembler is run in this process when no daemon is listening
+import json
+import os
+import socket
+import sys
+
+def request(path, argv):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        client.connect(path)
+        client.sendall((json.dumps({"argv": argv, "cwd": os.getcwd()}) + "\n").encode())
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as f:
+            return json.loads(f.readline())
+
+if __name__ == "__main__":
+    path = os.environ.get("SICAS_SOCKET") or "/tmp/sicas-%d.sock" % os.getuid()
+    try:
+        response = request(path, sys.argv[1:])
+    except OSError:
+        sicas = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sicas.py")
+        os.execv(sys.executable, [sys.executable, sicas] + sys.argv[1:])
+    sys.stdout.write(response["output"])
+    sys.exit(response["status"])
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import sicas
+
+# the socket shared by the daemon and the client
+def socket_path():
+    return os.environ.get("SICAS_SOCKET") or "/tmp/sicas-%d.sock" % os.getuid()
+
+# run the command line of one request in a worker process, everything printed
+# by the assembler (progress, diagnostics and statistics) is returned
+def run(argv, cwd):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        try:
+            os.chdir(cwd)
+            status = sicas.main(argv, prog="sicas.py")
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except OSError as e:
+            print("%s: %s" % (cwd, e.strerror))
+            status = 1
+    return (status, out.getvalue())
+
+# a request is one JSON line {"argv": [...], "cwd": "..."}, the response is one
+# JSON line {"status": N, "output": "..."}
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv, cwd = (request["argv"], request["cwd"])
+            if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv) or not isinstance(cwd, str):
+                raise TypeError("argv must be a list of strings and cwd a string")
+        except (ValueError, KeyError, TypeError) as e:
+            status, output = (2, "sicasd: bad request (%s)\n" % e)
+        else:
+            try:
+                status, output = self.server.pool.submit(run, argv, cwd).result()
+            except concurrent.futures.process.BrokenProcessPool:
+                status, output = (1, "sicasd: worker died\n")
+            # a failure of the assembler itself, not of the request
+            except Exception as e:
+                status, output = (1, "sicasd: internal error (%s: %s)\n" % (type(e).__name__, e))
+        response = json.dumps({"status": status, "output": output}) + "\n"
+        self.wfile.write(response.encode())
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, workers):
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        # start the workers now so the first requests do not wait for them
+        for future in [self.pool.submit(os.getpid) for i in range(workers)]:
+            future.result()
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.shutdown()
+
+# remove the socket left by a daemon which is gone, fail if one is running
+def claim_socket(path):
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError("a daemon is already listening on %s" % path)
+
+def serve(path, workers):
+    claim_socket(path)
+    server = Server(path, workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("sicasd listening on %s with %d workers" % (path, workers))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A SIC/XE assembler daemon")
+    parser.add_argument('-s', '--socket', default=socket_path(), help='the Unix socket to listen on (default: $SICAS_SOCKET or /tmp/sicas-UID.sock).')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='number of requests assembled in parallel (default: number of CPUs).')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("number of workers must be at least 1.")
+    try:
+        serve(args.socket, args.workers)
+    except OSError as e:
+        print("Error : %s" % e)
+        sys.exit(1)
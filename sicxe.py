@@ -2,6 +2,10 @@ BYTESIZE = 8
 
 REF_OP = 0x0
 REF_BASE = 0x1
+REF_EXPR = 0x2
+REF_EQU = 0x3
+REF_WORD = 0x4
+REF_REG = 0x5
 
 MODE_C = 0x1
 MODE_F = 0x2
@@ -25,6 +29,7 @@ EXTEND_FMT = 0b000001 << 12
 class instruction:
     def __init__(self, opcode, fmt, mode=""):
         self.opcode = opcode << ((fmt - 1) * BYTESIZE)
+        self.fmt = fmt
         self.inf = 0x10 << (4 - fmt)
         if self.inf & FORMAT3:
             self.inf |= FORMAT4
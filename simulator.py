@@ -0,0 +1,490 @@
+#!/usr/bin/python
+
+import argparse
+import sys
+import time
+from sicxe import *
+from binobj import MappedObject, is_binary
+
+MEMORY_SIZE = 1 << 20
+WORD_MASK = 0xFFFFFF
+
+# register numbers
+A = PRELOAD_SYMTAB["A"]
+X = PRELOAD_SYMTAB["X"]
+L = PRELOAD_SYMTAB["L"]
+B = PRELOAD_SYMTAB["B"]
+S = PRELOAD_SYMTAB["S"]
+T = PRELOAD_SYMTAB["T"]
+F = PRELOAD_SYMTAB["F"]
+PC = PRELOAD_SYMTAB["PC"]
+SW = PRELOAD_SYMTAB["SW"]
+
+# the return address of the main routine, returning to it halts the machine
+HALT = 0xFFFFF
+
+# condition codes stored in SW
+CC_LT = 0x40
+CC_EQ = 0x00
+CC_GT = 0x80
+
+# A class to indicate an error while executing
+class SimulatorError(Exception):
+    pass
+
+def signed(value):
+    return value - (1 << 24) if value & 0x800000 else value
+
+def compare(a, b):
+    if a < b:
+        return CC_LT
+    elif a > b:
+        return CC_GT
+    return CC_EQ
+
+# convert between the 48 bits floating point format and python floats
+def to_float(bits):
+    fraction = bits & ((1 << 36) - 1)
+    if fraction == 0:
+        return 0.0
+    exponent = (bits >> 36) & 0x7FF
+    value = fraction / (1 << 36) * 2.0 ** (exponent - 1024)
+    return -value if bits >> 47 else value
+
+def from_float(value):
+    if value == 0:
+        return 0
+    sign = 1 if value < 0 else 0
+    value = abs(value)
+    exponent = 1024
+    while value >= 1.0:
+        value /= 2
+        exponent += 1
+    while value < 0.5:
+        value *= 2
+        exponent -= 1
+    return (sign << 47) | ((exponent & 0x7FF) << 36) | (int(value * (1 << 36)) & ((1 << 36) - 1))
+
+# raised by the instructions which stop the machine
+class Halt(Exception):
+    pass
+
+def word(mem, addr):
+    return (mem[addr] << 16) | (mem[addr + 1] << 8) | mem[addr + 2]
+
+def store_word(mem, addr, value):
+    mem[addr] = (value >> 16) & 0xFF
+    mem[addr + 1] = (value >> 8) & 0xFF
+    mem[addr + 2] = value & 0xFF
+
+# decode the target address of a format 3/4 instruction and advance PC,
+# return (target address, ni), the indirection is already resolved
+def target(mem, reg):
+    pc = reg[PC]
+    ni = mem[pc] & 0x3
+    xbpe = mem[pc + 1]
+    if ni == 0:
+        ta = ((xbpe & 0x7F) << 8) | mem[pc + 2]
+        reg[PC] = pc + 3
+        if xbpe & 0x80:
+            ta += reg[X]
+        return ta & 0xFFFFF, 3
+    if xbpe & 0x10:
+        ta = ((xbpe & 0xF) << 16) | (mem[pc + 2] << 8) | mem[pc + 3]
+        pc += 4
+    else:
+        ta = ((xbpe & 0xF) << 8) | mem[pc + 2]
+        pc += 3
+        if xbpe & 0x20:
+            if ta & 0x800:
+                ta -= 0x1000
+            ta += pc
+        elif xbpe & 0x40:
+            ta += reg[B]
+    if xbpe & 0x80:
+        ta += reg[X]
+    reg[PC] = pc
+    ta &= 0xFFFFF
+    if ni == 2:
+        ta = word(mem, ta) & 0xFFFFF
+    return ta, ni
+
+# the word operand of a format 3/4 instruction
+def operand(mem, reg):
+    ta, ni = target(mem, reg)
+    if ni == 1:
+        return ta
+    return (mem[ta] << 16) | (mem[ta + 1] << 8) | mem[ta + 2]
+
+def store_target(mem, reg):
+    pc = reg[PC]
+    ta, ni = target(mem, reg)
+    if ni == 1:
+        raise SimulatorError("store to an immediate operand at %06X" % pc)
+    return ta
+
+# the registers of a format 2 instruction, advance PC
+def registers(mem, reg):
+    pc = reg[PC]
+    r = mem[pc + 1]
+    reg[PC] = pc + 2
+    return r >> 4, r & 0xF
+
+# class of a SIC/XE machine, memory is a bytearray and registers a list
+# indexed by register number
+class Machine:
+    def __init__(self, memory_size=MEMORY_SIZE):
+        self.mem = bytearray(memory_size)
+        self.reg = [0] * 10
+        self.reg[L] = HALT
+        self.halted = False
+        self.count = 0
+        # iterators of the bytes read from each device, and the bytes written
+        self.inputs = {}
+        self.outputs = {}
+
+    # load an object file, relocated by offset, return the entry point; the
+    # external references between control sections are not resolved, so an
+    # object of several sections is refused
+    def load(self, f, offset=0):
+        mem = self.mem
+        entry = 0
+        sections = 0
+        for record in f:
+            record = record.rstrip('\n')
+            if not record:
+                continue
+            kind = record[0]
+            if kind == 'H':
+                sections += 1
+                if sections > 1:
+                    raise SimulatorError("only objects of a single control section are supported.")
+            elif kind == 'T':
+                addr = int(record[1:7], 16) + offset
+                code = bytes.fromhex(record[9:9 + int(record[7:9], 16) * 2])
+                mem[addr:addr + len(code)] = code
+            elif kind == 'M':
+                addr = int(record[1:7], 16) + offset
+                mask = (1 << (int(record[7:9], 16) * 4)) - 1
+                value = word(mem, addr)
+                store_word(mem, addr, (value & ~mask) | ((value + offset) & mask))
+            elif kind == 'E' and len(record.strip()) > 1:
+                entry = int(record[1:7], 16) + offset
+        return entry
+
+    # load a binary object file, each text block is copied at once
+    def load_binary(self, obj, offset=0):
+        mem = self.mem
+        if len(obj.sections) > 1:
+            raise SimulatorError("only objects of a single control section are supported.")
+        for section in obj.sections:
+            for addr, start, size in section.blocks():
+                mem[addr + offset:addr + offset + size] = section.code(start, size)
+            for addr, halfbytes, symbol in section.modifications():
+                addr += offset
+                mask = (1 << (halfbytes * 4)) - 1
+                value = word(mem, addr)
+                store_word(mem, addr, (value & ~mask) | ((value + offset) & mask))
+        return (obj.entry or 0) + offset
+
+    # execute from the current PC until halted or limit instructions executed
+    def run(self, limit=None):
+        mem = self.mem
+        reg = self.reg
+        table = DISPATCH
+        if limit is None:
+            limit = sys.maxsize
+        count = 0
+        try:
+            while count < limit:
+                table[mem[reg[PC]]](self, mem, reg)
+                count += 1
+        except Halt:
+            self.halted = True
+            count += 1
+        except TypeError:
+            if table[mem[reg[PC]]] is None:
+                raise SimulatorError("invalid opcode %02X at %06X" % (mem[reg[PC]], reg[PC]))
+            raise
+        except IndexError:
+            raise SimulatorError("memory access out of range at %06X" % reg[PC])
+        finally:
+            self.count += count
+        return count
+
+# the semantic of each instruction, executed with the machine, its memory and registers
+def op_ADD(m, mem, reg):
+    reg[A] = (reg[A] + operand(mem, reg)) & WORD_MASK
+
+def op_SUB(m, mem, reg):
+    reg[A] = (reg[A] - operand(mem, reg)) & WORD_MASK
+
+def op_MUL(m, mem, reg):
+    reg[A] = (signed(reg[A]) * signed(operand(mem, reg))) & WORD_MASK
+
+def op_DIV(m, mem, reg):
+    divisor = signed(operand(mem, reg))
+    if divisor == 0:
+        raise SimulatorError("division by zero at %06X" % reg[PC])
+    reg[A] = int(signed(reg[A]) / divisor) & WORD_MASK
+
+def op_AND(m, mem, reg):
+    reg[A] &= operand(mem, reg)
+
+def op_OR(m, mem, reg):
+    reg[A] |= operand(mem, reg)
+
+# the comparisons are inlined as they are in most loops
+def op_COMP(m, mem, reg):
+    a = (reg[A] ^ 0x800000) - 0x800000
+    b = (operand(mem, reg) ^ 0x800000) - 0x800000
+    reg[SW] = CC_LT if a < b else CC_GT if a > b else CC_EQ
+
+def op_TIX(m, mem, reg):
+    x = (reg[X] + 1) & WORD_MASK
+    reg[X] = x
+    x = (x ^ 0x800000) - 0x800000
+    b = (operand(mem, reg) ^ 0x800000) - 0x800000
+    reg[SW] = CC_LT if x < b else CC_GT if x > b else CC_EQ
+
+def op_J(m, mem, reg):
+    pc = reg[PC]
+    reg[PC] = target(mem, reg)[0]
+    # a jump to itself is the usual way to stop
+    if reg[PC] == pc or reg[PC] == HALT:
+        raise Halt
+
+def op_JEQ(m, mem, reg):
+    ta = target(mem, reg)[0]
+    if reg[SW] == CC_EQ:
+        reg[PC] = ta
+
+def op_JGT(m, mem, reg):
+    ta = target(mem, reg)[0]
+    if reg[SW] == CC_GT:
+        reg[PC] = ta
+
+def op_JLT(m, mem, reg):
+    ta = target(mem, reg)[0]
+    if reg[SW] == CC_LT:
+        reg[PC] = ta
+
+def op_JSUB(m, mem, reg):
+    ta = target(mem, reg)[0]
+    reg[L] = reg[PC]
+    reg[PC] = ta
+
+def op_RSUB(m, mem, reg):
+    target(mem, reg)
+    if reg[L] == HALT:
+        raise Halt
+    reg[PC] = reg[L]
+
+def load(r):
+    def op(m, mem, reg):
+        reg[r] = operand(mem, reg)
+    return op
+
+def store(r):
+    def op(m, mem, reg):
+        store_word(mem, store_target(mem, reg), reg[r])
+    return op
+
+def op_LDCH(m, mem, reg):
+    ta, ni = target(mem, reg)
+    reg[A] = (reg[A] & 0xFFFF00) | (ta & 0xFF if ni == 1 else mem[ta])
+
+def op_STCH(m, mem, reg):
+    mem[store_target(mem, reg)] = reg[A] & 0xFF
+
+def op_LDF(m, mem, reg):
+    ta, ni = target(mem, reg)
+    reg[F] = int.from_bytes(mem[ta:ta + 6], "big")
+
+def op_STF(m, mem, reg):
+    ta = store_target(mem, reg)
+    mem[ta:ta + 6] = reg[F].to_bytes(6, "big")
+
+def float_operand(mem, reg):
+    ta, ni = target(mem, reg)
+    return to_float(int.from_bytes(mem[ta:ta + 6], "big"))
+
+def op_ADDF(m, mem, reg):
+    reg[F] = from_float(to_float(reg[F]) + float_operand(mem, reg))
+
+def op_SUBF(m, mem, reg):
+    reg[F] = from_float(to_float(reg[F]) - float_operand(mem, reg))
+
+def op_MULF(m, mem, reg):
+    reg[F] = from_float(to_float(reg[F]) * float_operand(mem, reg))
+
+def op_DIVF(m, mem, reg):
+    divisor = float_operand(mem, reg)
+    if divisor == 0:
+        raise SimulatorError("division by zero at %06X" % reg[PC])
+    reg[F] = from_float(to_float(reg[F]) / divisor)
+
+def op_COMPF(m, mem, reg):
+    reg[SW] = compare(to_float(reg[F]), float_operand(mem, reg))
+
+def op_FIX(m, mem, reg):
+    reg[PC] += 1
+    reg[A] = int(to_float(reg[F])) & WORD_MASK
+
+def op_FLOAT(m, mem, reg):
+    reg[PC] += 1
+    reg[F] = from_float(float(signed(reg[A])))
+
+def op_NORM(m, mem, reg):
+    # floating point values are always kept normalized
+    reg[PC] += 1
+
+def op_ADDR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    reg[r2] = (reg[r2] + reg[r1]) & WORD_MASK
+
+def op_SUBR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    reg[r2] = (reg[r2] - reg[r1]) & WORD_MASK
+
+def op_MULR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    reg[r2] = (signed(reg[r2]) * signed(reg[r1])) & WORD_MASK
+
+def op_DIVR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    if reg[r1] == 0:
+        raise SimulatorError("division by zero at %06X" % reg[PC])
+    reg[r2] = int(signed(reg[r2]) / signed(reg[r1])) & WORD_MASK
+
+def op_COMPR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    reg[SW] = compare(signed(reg[r1]), signed(reg[r2]))
+
+def op_CLEAR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    reg[r1] = 0
+
+def op_RMO(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    reg[r2] = reg[r1]
+
+def op_SHIFTL(m, mem, reg):
+    r1, n = registers(mem, reg)
+    n += 1
+    value = reg[r1]
+    reg[r1] = ((value << n) | (value >> (24 - n))) & WORD_MASK
+
+def op_SHIFTR(m, mem, reg):
+    r1, n = registers(mem, reg)
+    reg[r1] = (signed(reg[r1]) >> (n + 1)) & WORD_MASK
+
+def op_TIXR(m, mem, reg):
+    r1, r2 = registers(mem, reg)
+    x = (reg[X] + 1) & WORD_MASK
+    reg[X] = x
+    x = (x ^ 0x800000) - 0x800000
+    b = (reg[r1] ^ 0x800000) - 0x800000
+    reg[SW] = CC_LT if x < b else CC_GT if x > b else CC_EQ
+
+def op_SVC(m, mem, reg):
+    registers(mem, reg)
+    raise Halt
+
+# devices are always ready, reading past the end of an input gives 0
+def op_TD(m, mem, reg):
+    target(mem, reg)
+    reg[SW] = CC_LT
+
+def op_RD(m, mem, reg):
+    ta, ni = target(mem, reg)
+    device = ta & 0xFF if ni == 1 else mem[ta]
+    data = m.inputs.get(device)
+    value = next(data, 0) if data is not None else 0
+    reg[A] = (reg[A] & 0xFFFF00) | value
+
+def op_WD(m, mem, reg):
+    ta, ni = target(mem, reg)
+    device = ta & 0xFF if ni == 1 else mem[ta]
+    m.outputs.setdefault(device, bytearray()).append(reg[A] & 0xFF)
+
+OPS = {
+    "ADD": op_ADD, "ADDF": op_ADDF, "ADDR": op_ADDR, "AND": op_AND,
+    "CLEAR": op_CLEAR, "COMP": op_COMP, "COMPF": op_COMPF, "COMPR": op_COMPR,
+    "DIV": op_DIV, "DIVF": op_DIVF, "DIVR": op_DIVR, "FIX": op_FIX,
+    "FLOAT": op_FLOAT, "J": op_J, "JEQ": op_JEQ, "JGT": op_JGT,
+    "JLT": op_JLT, "JSUB": op_JSUB, "LDA": load(A), "LDB": load(B),
+    "LDCH": op_LDCH, "LDF": op_LDF, "LDL": load(L), "LDS": load(S),
+    "LDT": load(T), "LDX": load(X), "MUL": op_MUL, "MULF": op_MULF,
+    "MULR": op_MULR, "NORM": op_NORM, "OR": op_OR, "RD": op_RD,
+    "RMO": op_RMO, "RSUB": op_RSUB, "SHIFTL": op_SHIFTL, "SHIFTR": op_SHIFTR,
+    "STA": store(A), "STB": store(B), "STCH": op_STCH, "STF": op_STF,
+    "STL": store(L), "STS": store(S), "STSW": store(SW), "STT": store(T),
+    "STX": store(X), "SUB": op_SUB, "SUBF": op_SUBF, "SUBR": op_SUBR,
+    "SVC": op_SVC, "TD": op_TD, "TIX": op_TIX, "TIXR": op_TIXR,
+    "WD": op_WD,
+}
+
+# build the dispatch table indexed by the first byte of an instruction, the
+# privileged instructions (HIO, LPS, SIO, SSK, STI, TIO) are not simulated
+def dispatch_table():
+    table = [None] * 256
+    for name, inst in OPTAB.items():
+        op = OPS.get(name)
+        if op is None:
+            continue
+        opcode = inst.opcode >> ((inst.fmt - 1) * BYTESIZE)
+        if inst.fmt == 3:
+            for ni in range(4):
+                table[opcode | ni] = op
+        else:
+            table[opcode] = op
+    return table
+
+DISPATCH = dispatch_table()
+
+def device_file(text):
+    device, filename = text.split('=', 1)
+    return (int(device, 16), filename)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A SIC/XE simulator")
+    parser.add_argument('-n', '--steps', type=int, help='stop after this number of instructions.')
+    parser.add_argument('-l', '--load', type=lambda x: int(x, 16), default=0, help='relocate the program by this hex offset.')
+    parser.add_argument('-i', '--input', action='append', type=device_file, default=[], help='read device DEV from FILE, as DEV=FILE.')
+    parser.add_argument('-w', '--write', action='append', type=device_file, default=[], help='write device DEV to FILE, as DEV=FILE.')
+    parser.add_argument('input_object', metavar='input', help='the object file.')
+    args = parser.parse_args()
+
+    machine = Machine()
+    try:
+        if is_binary(args.input_object):
+            with MappedObject(args.input_object) as obj:
+                machine.reg[PC] = machine.load_binary(obj, args.load)
+        else:
+            with open(args.input_object, "r") as f:
+                machine.reg[PC] = machine.load(f, args.load)
+    except SimulatorError as e:
+        print("Error : %s" % e)
+        sys.exit(1)
+    for device, filename in args.input:
+        with open(filename, "rb") as f:
+            machine.inputs[device] = iter(f.read())
+
+    start = time.perf_counter()
+    try:
+        machine.run(args.steps)
+    except SimulatorError as e:
+        print("Error : %s" % e)
+    elapsed = time.perf_counter() - start
+
+    written = dict(args.write)
+    for device, data in machine.outputs.items():
+        if device in written:
+            with open(written[device], "wb") as f:
+                f.write(data)
+        else:
+            print("device %02X: %r" % (device, bytes(data)))
+    print("%s after %d instructions in %.3fs (%.0f instructions/s)" % (
+        "Halted" if machine.halted else "Stopped", machine.count, elapsed, machine.count / elapsed if elapsed else 0))
+    print(" ".join("%s=%06X" % (name, machine.reg[num] if num != F else 0) for name, num in PRELOAD_SYMTAB.items() if name != "F"))
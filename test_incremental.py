@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from incremental import Incremental
+from sicas import Program
+
+SOURCE = """\
+PROG    START   0
+        EXTREF  EXT
+FIRST   +JSUB   EXT
+        LDA     DAT
+        RSUB
+DAT     WORD    EXT
+VAL     WORD    3
+        END     FIRST
+"""
+
+# the object files written by an incremental and a clean assemble of the
+# source after each edit must be the same
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.dir.name, "prog.asm")
+        self.text = SOURCE
+        self.write()
+        self.incremental = Incremental(self.source)
+        self.assemble(self.incremental.assemble)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self):
+        with open(self.source, "w") as f:
+            f.write(self.text)
+
+    def assemble(self, run):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return run()
+
+    def output(self, program, name):
+        path = os.path.join(self.dir.name, name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            program.output(path)
+        with open(path, "r") as f:
+            return f.read()
+
+    def clean(self):
+        program = Program(self.source)
+        self.assemble(program.assemble)
+        return program
+
+    def edit(self, old, new):
+        self.text = self.text.replace(old, new, 1)
+        self.write()
+        partial_runs = self.incremental.partial_runs
+        program = self.assemble(self.incremental.assemble)
+        self.assertEqual(self.incremental.partial_runs, partial_runs + 1)
+        self.assertEqual(self.output(program, "incremental.obj"), self.output(self.clean(), "clean.obj"))
+
+    def test_external_to_local(self):
+        self.edit("+JSUB   EXT", "+JSUB   DAT")
+
+    def test_local_to_external(self):
+        self.edit("+JSUB   EXT", "+JSUB   DAT")
+        self.edit("+JSUB   DAT", "+JSUB   EXT")
+
+    def test_word_external_to_constant(self):
+        self.edit("WORD    EXT", "WORD    3")
+
+    def test_word_constant_to_external(self):
+        self.edit("VAL     WORD    3", "VAL     WORD    EXT")
+
+if __name__ == "__main__":
+    unittest.main()